@@ -16,10 +16,12 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from location.views import register,index
+from location.views import register,index,duplicate_candidates,change_feed
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('welcome/',index, name='index'),
     path('register/',register, name='register'),
+    path('duplicates/',duplicate_candidates, name='duplicate_candidates'),
+    path('changes/',change_feed, name='change_feed'),
 ]
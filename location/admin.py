@@ -1,10 +1,21 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.actions import delete_selected
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME, ActionForm
+from django.http import HttpResponseRedirect
+from django.template.defaultfilters import pluralize
+from django.template.response import TemplateResponse
+from django.urls import reverse
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 from leaflet.admin import LeafletGeoAdmin
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from .models import Location, Accommodation, AccommodationImage, LocalizeAccommodation
+from .models import (
+    Location, Accommodation, AccommodationImage, LocalizeAccommodation,
+    BulkAccommodationJob, LocationSubtreeOperation,
+)
+from . import bulk, subtree
 
 
 ### RESOURCE CLASS FOR LOCATION ###
@@ -22,9 +33,106 @@ class LocationAdmin(ImportExportModelAdmin, LeafletGeoAdmin):
     """Admin interface for managing Location model."""
     
     resource_class = LocationResource
-    list_display = ('id', 'title', 'location_type', 'country_code', 'state_abbr', 'city')
+    list_display = ('id', 'title', 'location_type', 'country_code', 'state_abbr', 'city', 'accommodation_count', 'published_count')
+    readonly_fields = ('accommodation_count', 'published_count')
     search_fields = ('title', 'country_code', 'state_abbr', 'city')
     list_filter = ('location_type', 'country_code')
+    actions = ['archive_subtree']
+
+    def get_deleted_objects(self, objs, request):
+        """Summarize a subtree delete with COUNT queries instead of collecting every descendant row."""
+        model_count, perms_needed = {}, set()
+        for obj in objs:
+            for model, count in subtree.subtree_counts(obj.pk).items():
+                opts = model._meta
+                model_count[opts.verbose_name_plural] = model_count.get(opts.verbose_name_plural, 0) + count
+                if count and not request.user.has_perm(f"{opts.app_label}.delete_{opts.model_name}"):
+                    perms_needed.add(opts.verbose_name)
+        deleted_objects = [f"{obj} and all locations below it" for obj in objs]
+        return deleted_objects, model_count, perms_needed, []
+
+    def get_actions(self, request):
+        """Swap in a delete action that reports queued subtrees instead of claiming they were deleted."""
+        actions = super().get_actions(request)
+        if 'delete_selected' in actions:
+            _, name, description = actions['delete_selected']
+            actions['delete_selected'] = (LocationAdmin.delete_selected_subtrees, name, description)
+        return actions
+
+    def delete_selected_subtrees(self, request, queryset):
+        if not request.POST.get('post'):
+            return delete_selected(self, request, queryset)  # Django's confirmation page
+        self.check_subtree_permissions(request, queryset)
+        self.remove_subtrees(request, queryset, LocationSubtreeOperation.DELETE, report=True)
+        return None
+
+    def check_subtree_permissions(self, request, queryset):
+        """Like delete_selected: every kind of row below the locations must be deletable by the user."""
+        _, _, perms_needed, _ = self.get_deleted_objects(queryset, request)
+        if not self.has_delete_permission(request) or perms_needed:
+            raise PermissionDenied
+
+    def log_deletions(self, request, queryset):
+        """Deletions are logged by remove_subtrees once a subtree is actually gone, not when it is queued."""
+
+    def delete_model(self, request, obj):
+        request.queued_subtree_operations = self.remove_subtrees(request, [obj], LocationSubtreeOperation.DELETE)
+
+    def response_delete(self, request, obj_display, obj_id):
+        """After a change-view delete, say the subtree was queued rather than deleted when it was."""
+        if not getattr(request, 'queued_subtree_operations', None):
+            return super().response_delete(request, obj_display, obj_id)
+        self.message_user(
+            request,
+            f"{obj_display} was queued for deletion as operation #{request.queued_subtree_operations[0].pk}.",
+            messages.INFO,
+        )
+        return HttpResponseRedirect(reverse('admin:location_location_changelist'))
+
+    def delete_queryset(self, request, queryset):
+        self.remove_subtrees(request, queryset, LocationSubtreeOperation.DELETE)
+
+    @admin.action(description="Archive selected locations and everything below them", permissions=['delete'])
+    def archive_subtree(self, request, queryset):
+        self.check_subtree_permissions(request, queryset)
+        self.remove_subtrees(request, queryset, LocationSubtreeOperation.ARCHIVE, report=True)
+
+    def remove_subtrees(self, request, locations, mode, report=False):
+        """
+        Remove each subtree in batches; large ones are queued for the delete_location_subtree
+        command. Returns the queued operations; with ``report`` the outcome is messaged to the user.
+        """
+        done, queued = [], []
+        for location in locations:
+            if location.accommodation_count <= subtree.SUBTREE_SYNC_LIMIT:
+                # Created already claimed, so a concurrent runner does not pick it up.
+                operation = LocationSubtreeOperation.objects.create(
+                    root_id=location.pk, mode=mode, user=request.user, status=LocationSubtreeOperation.RUNNING
+                )
+                subtree.run_subtree_operation(operation)
+                done.append(location)
+            else:
+                operation = LocationSubtreeOperation.objects.create(root_id=location.pk, mode=mode, user=request.user)
+                queued.append(operation)
+
+        if done:
+            super().log_deletions(request, done)
+
+        if report:
+            verb = "archived" if mode == LocationSubtreeOperation.ARCHIVE else "deleted"
+            if done:
+                self.message_user(
+                    request,
+                    f"Successfully {verb} {len(done)} location{pluralize(len(done))} and everything below them.",
+                    messages.SUCCESS,
+                )
+            for operation in queued:
+                self.message_user(
+                    request,
+                    f"{operation.root_id} has too many accommodations to be {verb} now; queued as operation #{operation.pk}.",
+                    messages.INFO,
+                )
+        return queued
 
 
 ### INLINE ADMIN FOR ACCOMMODATION IMAGES ###
@@ -37,6 +145,14 @@ class AccommodationImageInline(admin.TabularInline):
     readonly_fields = ('uploaded_at',)
 
 
+### ACTION FORM FOR ACCOMMODATION BULK ACTIONS ###
+class AccommodationActionForm(ActionForm):
+    """Adds the target location id used by the 'reassign location' action."""
+
+    # A plain id field: a <select> of every Location would be rendered on each changelist page.
+    location = forms.CharField(max_length=20, required=False, label="Location id")
+
+
 ### ACCOMMODATION ADMIN ###
 @admin.register(Accommodation)
 class AccommodationAdmin(LeafletGeoAdmin):
@@ -47,6 +163,8 @@ class AccommodationAdmin(LeafletGeoAdmin):
     search_fields = ('title', 'country_code', 'location__title')
     ordering = ('-created_at',)
     inlines = [AccommodationImageInline]
+    action_form = AccommodationActionForm
+    actions = ['publish_selected', 'unpublish_selected', 'reassign_location', 'delete_selected_in_batches']
 
     def get_queryset(self, request):
         """Show only accommodations created by the logged-in user if in 'Property Owners' group."""
@@ -79,6 +197,111 @@ class AccommodationAdmin(LeafletGeoAdmin):
             kwargs["queryset"] = User.objects.filter(id=request.user.id)
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
+    def get_actions(self, request):
+        """Replace the default delete action, which loads every object and its cascades into memory."""
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def run_bulk_action(self, request, queryset, action, location_id=None):
+        """Apply an action set-based; large selections are queued as a background job."""
+        total = queryset.count()
+        if total <= bulk.BULK_ACTION_SYNC_LIMIT:
+            processed = bulk.apply_bulk_action(queryset, action, location_id=location_id)
+            self.message_user(request, f"{processed} accommodations processed.", messages.SUCCESS)
+        else:
+            job = bulk.enqueue_bulk_action(queryset, action, user=request.user, location_id=location_id)
+            self.message_user(
+                request,
+                f"{total} accommodations queued as job #{job.pk}; follow its progress under Bulk Accommodation Jobs.",
+                messages.INFO,
+            )
+
+    @admin.action(description="Publish selected accommodations", permissions=['change'])
+    def publish_selected(self, request, queryset):
+        self.run_bulk_action(request, queryset, BulkAccommodationJob.PUBLISH)
+
+    @admin.action(description="Unpublish selected accommodations", permissions=['change'])
+    def unpublish_selected(self, request, queryset):
+        self.run_bulk_action(request, queryset, BulkAccommodationJob.UNPUBLISH)
+
+    @admin.action(description="Reassign selected accommodations to location", permissions=['change'])
+    def reassign_location(self, request, queryset):
+        form = self.action_form(request.POST)
+        location_id = form.cleaned_data['location'].strip() if form.is_valid() else ''
+        if not location_id:
+            self.message_user(request, "Enter the id of the location to reassign the accommodations to.", messages.ERROR)
+            return
+        if not Location.objects.filter(pk=location_id).exists():
+            self.message_user(request, f"There is no location with id '{location_id}'.", messages.ERROR)
+            return
+        self.run_bulk_action(request, queryset, BulkAccommodationJob.REASSIGN, location_id=location_id)
+
+    @admin.action(description="Delete selected accommodations", permissions=['delete'])
+    def delete_selected_in_batches(self, request, queryset):
+        """Like Django's delete_selected: ask for confirmation first, delete only once it is posted back."""
+        if request.POST.get('post'):
+            self.run_bulk_action(request, queryset, BulkAccommodationJob.DELETE)
+            return None
+
+        count = queryset.count()
+        context = {
+            **self.admin_site.each_context(request),
+            'title': "Are you sure?",
+            'opts': self.model._meta,
+            'count': count,
+            'queued': count > bulk.BULK_ACTION_SYNC_LIMIT,
+            'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, "admin/location/accommodation/delete_selected_confirmation.html", context)
+
+
+### BULK ACCOMMODATION JOB ADMIN ###
+@admin.register(BulkAccommodationJob)
+class BulkAccommodationJobAdmin(admin.ModelAdmin):
+    """Read-only progress view for queued bulk accommodation actions."""
+
+    list_display = ('id', 'action', 'location', 'user', 'status', 'processed', 'total', 'progress_display', 'created_at', 'updated_at')
+    list_filter = ('status', 'action')
+    ordering = ('-created_at',)
+    readonly_fields = ('action', 'location', 'user', 'status', 'total', 'processed', 'last_pk', 'error', 'created_at', 'updated_at')
+
+    @admin.display(description="Progress")
+    def progress_display(self, obj):
+        return f"{obj.progress}%"
+
+    def get_queryset(self, request):
+        """Property Owners only see the jobs they started."""
+        qs = super().get_queryset(request)
+        if request.user.groups.filter(name='Property Owners').exists():
+            return qs.filter(user=request.user)
+        return qs
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+### LOCATION SUBTREE OPERATION ADMIN ###
+@admin.register(LocationSubtreeOperation)
+class LocationSubtreeOperationAdmin(admin.ModelAdmin):
+    """Read-only progress view for batched subtree deletes and archives."""
+
+    list_display = ('id', 'root_id', 'mode', 'user', 'status', 'accommodations_removed', 'locations_removed', 'created_at', 'updated_at')
+    list_filter = ('status', 'mode')
+    ordering = ('-created_at',)
+    readonly_fields = ('root_id', 'mode', 'user', 'status', 'accommodations_removed', 'locations_removed', 'error', 'created_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 ### ACCOMMODATION IMAGE ADMIN ###
 @admin.register(AccommodationImage)
@@ -0,0 +1,156 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import rollups
+from .models import Accommodation, AccommodationImage, BulkAccommodationJob, BulkAccommodationJobItem, PendingFileDeletion
+from .signals import accommodations_bulk_changed
+
+
+# Selections up to this size are processed inside the admin request,
+# anything larger is queued as a BulkAccommodationJob.
+BULK_ACTION_SYNC_LIMIT = getattr(settings, 'BULK_ACTION_SYNC_LIMIT', 1000)
+BULK_ACTION_CHUNK_SIZE = getattr(settings, 'BULK_ACTION_CHUNK_SIZE', 500)
+# A RUNNING job whose progress has not moved for this long is assumed dead and may be reclaimed.
+BULK_JOB_STALE_AFTER = getattr(settings, 'BULK_JOB_STALE_AFTER', timedelta(minutes=10))
+
+
+def iter_pk_chunks(queryset, chunk_size=BULK_ACTION_CHUNK_SIZE, after=None):
+    """
+    Yield lists of primary keys from the queryset using keyset pagination on pk,
+    so each chunk is a cheap index range scan and the walk can resume from ``after``.
+    """
+    queryset = queryset.order_by('pk')
+    while True:
+        chunk = queryset.filter(pk__gt=after) if after is not None else queryset
+        pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield pks
+        after = pks[-1]
+
+
+def apply_to_chunk(action, pks, location_id=None, sweep_files=True):
+    """
+    Apply one bulk action to a chunk of accommodations with a single set-based statement.
+    Deleted image files are queued for sweep_deleted_files unless ``sweep_files`` is False.
+    Returns the number of rows in the chunk.
+    """
+    rows = Accommodation.objects.filter(pk__in=pks)
+    with transaction.atomic():
+        location_ids = set(rows.values_list('location_id', flat=True).distinct())
+        now = timezone.now()
+
+        if action == BulkAccommodationJob.PUBLISH:
+            rows.filter(published=False).update(published=True, updated_at=now)
+        elif action == BulkAccommodationJob.UNPUBLISH:
+            rows.filter(published=True).update(published=False, updated_at=now)
+        elif action == BulkAccommodationJob.REASSIGN:
+            if location_id is None:
+                raise ValueError("A target location is required to reassign accommodations.")
+            location_ids.add(location_id)
+            rows.exclude(location_id=location_id).update(location_id=location_id, updated_at=now)
+        elif action == BulkAccommodationJob.DELETE:
+            # The collector only ever holds this chunk and its images and localizations,
+            # and sends their post_delete signals (change log) in its transaction.
+            # Location counts are refreshed once for the whole batch below.
+            if sweep_files:
+                images = AccommodationImage.objects.filter(accommodation_id__in=pks).values_list('image', flat=True)
+                PendingFileDeletion.objects.bulk_create(PendingFileDeletion(name=name) for name in images if name)
+            with rollups.suspended():
+                rows.delete()
+        else:
+            raise ValueError(f"Unknown bulk action '{action}'.")
+
+        # Dependent caches/counters are refreshed once per batch, not once per row.
+        accommodations_bulk_changed.send(
+            sender=Accommodation, action=action, pks=pks, location_ids=location_ids
+        )
+    return len(pks)
+
+
+def apply_bulk_action(queryset, action, location_id=None, chunk_size=BULK_ACTION_CHUNK_SIZE):
+    """Run a bulk action over the whole queryset in chunks, returning the number of rows processed."""
+    return sum(
+        apply_to_chunk(action, pks, location_id=location_id)
+        for pks in iter_pk_chunks(queryset, chunk_size)
+    )
+
+
+def enqueue_bulk_action(queryset, action, user=None, location_id=None):
+    """
+    Queue a bulk action over the queryset. The selection is copied into BulkAccommodationJobItem
+    rows with one INSERT ... SELECT, so the job acts on exactly the rows the (owner-filtered)
+    changelist showed without the primary keys ever passing through Python.
+    """
+    quote = connection.ops.quote_name
+    items = BulkAccommodationJobItem._meta
+    select, params = queryset.order_by().values_list('pk', flat=True).query.get_compiler(queryset.db).as_sql()
+    with transaction.atomic():
+        job = BulkAccommodationJob.objects.create(action=action, location_id=location_id, user=user)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(items.db_table)} "
+                f"({quote(items.get_field('job').column)}, {quote(items.get_field('accommodation_id').column)}) "
+                f"SELECT %s, selection.* FROM ({select}) selection",
+                [job.pk, *params],
+            )
+            job.total = cursor.rowcount
+        job.save(update_fields=['total'])
+    return job
+
+
+def claim_job(job_id=None):
+    """
+    Atomically pick the oldest pending job (or a RUNNING one whose runner went quiet) and mark
+    it RUNNING. Rows locked by another runner are skipped, so each job has a single runner.
+    A job asked for by id may also be a FAILED one, which then resumes after its last chunk.
+    """
+    stale = timezone.now() - BULK_JOB_STALE_AFTER
+    claimable = Q(status=BulkAccommodationJob.PENDING) | Q(status=BulkAccommodationJob.RUNNING, updated_at__lt=stale)
+    if job_id is not None:
+        claimable |= Q(status=BulkAccommodationJob.FAILED)
+    jobs = BulkAccommodationJob.objects.select_for_update(skip_locked=True).filter(claimable).order_by('created_at')
+    if job_id is not None:
+        jobs = jobs.filter(pk=job_id)
+    with transaction.atomic():
+        job = jobs.first()
+        if job is not None:
+            job.status = BulkAccommodationJob.RUNNING
+            job.save(update_fields=['status', 'updated_at'])
+    return job
+
+
+def run_job(job, chunk_size=BULK_ACTION_CHUNK_SIZE):
+    """
+    Process a queued job chunk by chunk, walking its items by keyset on the accommodation id.
+    Progress and the ``last_pk`` cursor are saved in the same transaction as each chunk, so an
+    interrupted or failed job continues where it stopped; each saved chunk also refreshes
+    ``updated_at``, which keeps the job claimed.
+    """
+    job.status = BulkAccommodationJob.RUNNING
+    job.error = ''
+    job.save(update_fields=['status', 'error', 'updated_at'])
+
+    items = job.items.order_by('accommodation_id').values_list('accommodation_id', flat=True)
+    try:
+        while True:
+            chunk = items.filter(accommodation_id__gt=job.last_pk) if job.last_pk is not None else items
+            pks = list(chunk[:chunk_size])
+            if not pks:
+                break
+            with transaction.atomic():
+                apply_to_chunk(job.action, pks, location_id=job.location_id)
+                job.processed += len(pks)
+                job.last_pk = pks[-1]
+                job.save(update_fields=['processed', 'last_pk', 'updated_at'])
+    except Exception as e:
+        job.status = BulkAccommodationJob.FAILED
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+
+    job.status = BulkAccommodationJob.DONE
+    job.save(update_fields=['status', 'updated_at'])
+    return job
@@ -0,0 +1,142 @@
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Exists, Max, OuterRef, Q
+from django.utils import timezone
+from .models import ChangeLogEntry
+
+
+# Superseded entries older than this are compacted away (only the latest entry per object stays).
+CHANGE_LOG_COMPACT_AFTER = getattr(settings, 'CHANGE_LOG_COMPACT_AFTER', timedelta(days=1))
+# Delete tombstones older than this are dropped; consumers must sync at least this often.
+CHANGE_LOG_RETENTION = getattr(settings, 'CHANGE_LOG_RETENTION', timedelta(days=30))
+CHANGE_FEED_BATCH_SIZE = 1000
+
+
+def serialize_fields(instance):
+    """
+    Field values of a model instance as JSON-friendly Python (geometries as EWKT). Location
+    rollup counters are left out: they change through F() updates and are not change-logged.
+    """
+    fields = serializers.serialize('python', [instance])[0]['fields']
+    for name in getattr(instance, 'ROLLUP_FIELDS', ()):
+        fields.pop(name, None)
+    return fields
+
+
+def change_entry(instance, action):
+    return ChangeLogEntry(
+        model=instance._meta.label_lower,
+        object_id=str(instance.pk),
+        action=action,
+        data=serialize_fields(instance) if action == ChangeLogEntry.UPSERT else None,
+    )
+
+
+def record_change(instance, action):
+    """Append one entry; called from the model signals inside the change's transaction."""
+    change_entry(instance, action).save()
+
+
+def record_upserts(queryset):
+    """Append upsert entries for rows changed by a set-based update, with one SELECT and one INSERT."""
+    ChangeLogEntry.objects.bulk_create(change_entry(instance, ChangeLogEntry.UPSERT) for instance in queryset)
+
+
+def cursor_of(entry):
+    return f'{entry.xid}-{entry.id}'
+
+
+def parse_cursor(value):
+    """
+    A '<xid>-<id>' cursor as an (xid, id) tuple; '0' (or empty) is the start of the log.
+    A plain entry id, as handed out before cursors carried the xid, is looked up.
+    Raises ValueError for anything else.
+    """
+    value = str(value or '0')
+    if '-' in value:
+        xid, pk = value.split('-', 1)
+        return int(xid), int(pk)
+    pk = int(value)
+    if not pk:
+        return 0, 0
+    xid = ChangeLogEntry.objects.filter(pk=pk).values_list('xid', flat=True).first()
+    if xid is None:
+        raise ValueError(f"Unknown cursor '{value}'.")
+    return xid, pk
+
+
+def snapshot_xmin():
+    """The oldest transaction still running: every entry from an older one is committed (or gone)."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return cursor.fetchone()[0]
+
+
+def iter_changes(after='0', limit=None, batch_size=CHANGE_FEED_BATCH_SIZE):
+    """
+    Yield entries with a cursor greater than ``after`` in cursor order, reading ``batch_size`` rows
+    at a time. Entries are ordered by (transaction id, id) and served only up to the oldest running
+    transaction: a transaction that commits later always has a higher xid than that, so its entries
+    sort after everything already served, whatever order the transactions commit in.
+    """
+    xid, pk = parse_cursor(after)
+    safe = ChangeLogEntry.objects.filter(xid__lt=snapshot_xmin()).order_by('xid', 'id')
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        batch = list(safe.filter(Q(xid__gt=xid) | Q(xid=xid, id__gt=pk))[:size])
+        if not batch:
+            return
+        yield from batch
+        xid, pk = batch[-1].xid, batch[-1].id
+        if remaining is not None:
+            remaining -= len(batch)
+
+
+def to_ndjson(entry):
+    return json.dumps({
+        'cursor': cursor_of(entry),
+        'model': entry.model,
+        'object_id': entry.object_id,
+        'action': entry.action,
+        'data': entry.data,
+        'created_at': entry.created_at,
+    }, cls=DjangoJSONEncoder) + '\n'
+
+
+def compact_change_log(compact_after=CHANGE_LOG_COMPACT_AFTER, retention=CHANGE_LOG_RETENTION, batch_size=5000):
+    """
+    Drop entries superseded by a newer entry for the same object once they are older than
+    ``compact_after``, then drop delete tombstones older than ``retention``. Reading from
+    cursor 0 afterwards still yields the current state of every live object.
+
+    The window of old entries is walked once by keyset on id, and only each batch's own rows
+    are checked for a newer entry, so the cost grows with the window, not with the number of batches.
+    Returns the number of entries removed.
+    """
+    now = timezone.now()
+    compact_before, expire_before = now - compact_after, now - retention
+    window = ChangeLogEntry.objects.filter(created_at__lt=max(compact_before, expire_before))
+    last_id = window.aggregate(last=Max('id'))['last']
+    if last_id is None:
+        return 0
+
+    newer = ChangeLogEntry.objects.filter(model=OuterRef('model'), object_id=OuterRef('object_id')).filter(
+        Q(xid__gt=OuterRef('xid')) | Q(xid=OuterRef('xid'), id__gt=OuterRef('id'))
+    )
+    removable = (
+        Q(Exists(newer), created_at__lt=compact_before)
+        | Q(action=ChangeLogEntry.DELETE, created_at__lt=expire_before)
+    )
+
+    removed, after = 0, 0
+    while True:
+        ids = list(window.filter(id__gt=after, id__lte=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return removed
+        after = ids[-1]
+        removed += ChangeLogEntry.objects.filter(id__in=ids).filter(removable).delete()[0]
@@ -0,0 +1,155 @@
+import heapq
+import math
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from difflib import SequenceMatcher
+from .models import Accommodation
+
+
+EARTH_RADIUS_M = 6371008.8
+# On the same sphere as haversine_m, so a cell is never narrower than the distance it is sized for.
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+# Weights of the individual signals in the final pair score (sum to 1).
+TITLE_WEIGHT = 0.6
+BEDROOM_WEIGHT = 0.2
+RATE_WEIGHT = 0.2
+
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    """Great-circle distance in meters between two lon/lat points."""
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def normalize_title(title):
+    """Lowercase and collapse punctuation/whitespace so feed formatting does not affect similarity."""
+    return " ".join(re.sub(r"[^\w\s]", " ", title.lower()).split())
+
+
+def grid_cell(lon, lat, cell_size):
+    """Snap a point to its grid cell (same idea as ST_SnapToGrid)."""
+    return (math.floor(lon / cell_size), math.floor(lat / cell_size))
+
+
+def neighbour_cells(cell, cell_size):
+    """
+    Cells that may hold points within one cell size of ``cell``. A degree of longitude
+    shrinks with latitude, so more columns are scanned away from the equator.
+    """
+    x, y = cell
+    cells = []
+    for dy in (-1, 0, 1):
+        # Symmetric in (y, y + dy) so both cells agree on which pairs they share.
+        max_lat = min(89.0, (max(abs(y), abs(y + dy)) + 1) * cell_size)
+        span = math.ceil(1 / math.cos(math.radians(max_lat)))
+        cells.extend((x + dx, y + dy) for dx in range(-span, span + 1))
+    return cells
+
+
+def score_pair(a, b):
+    """
+    Score two candidate rows in [0, 1] from title similarity, bedroom_count and usd_rate.
+    Rows are (id, title, feed, bedroom_count, usd_rate, lon, lat) tuples.
+    """
+    title_score = SequenceMatcher(None, a[1], b[1]).ratio()
+    bedroom_score = 1.0 if a[3] == b[3] else 0.0
+    high = max(a[4], b[4])
+    rate_score = 1.0 - abs(a[4] - b[4]) / high if high else 1.0
+    return TITLE_WEIGHT * title_score + BEDROOM_WEIGHT * bedroom_score + RATE_WEIGHT * rate_score
+
+
+def _score_block(block):
+    """
+    Worker: compare the points of one cell with each other and with the points of its
+    neighbour cells that sort after it, so every pair is scored exactly once.
+    """
+    points, others, max_distance, min_score, cross_feed_only = block
+    pairs = []
+    for i, a in enumerate(points):
+        for b in points[i + 1:] + others:
+            if cross_feed_only and a[2] == b[2]:
+                continue
+            distance = haversine_m(a[5], a[6], b[5], b[6])
+            if distance > max_distance:
+                continue
+            score = score_pair(a, b)
+            if score >= min_score:
+                first, second = sorted((a[0], b[0]))
+                pairs.append((round(score, 4), first, second, round(distance, 1)))
+    return pairs
+
+
+def build_blocks(rows, max_distance, min_score, cross_feed_only):
+    """Bucket rows into grid cells sized to ``max_distance`` and yield one work unit per cell."""
+    if not (math.isfinite(max_distance) and max_distance > 0):
+        raise ValueError("max_distance must be a finite number of meters greater than 0.")
+    cell_size = max_distance / METERS_PER_DEGREE
+    cells = defaultdict(list)
+    for row in rows:
+        cells[grid_cell(row[5], row[6], cell_size)].append(row)
+
+    for cell, points in cells.items():
+        others = []
+        for neighbour in neighbour_cells(cell, cell_size):
+            if neighbour > cell and neighbour in cells:
+                others.extend(cells[neighbour])
+        if len(points) > 1 or others:
+            yield (points, others, max_distance, min_score, cross_feed_only)
+
+
+def load_rows(queryset):
+    """Stream the columns needed for matching without instantiating model objects."""
+    rows = queryset.values_list("id", "title", "feed", "bedroom_count", "usd_rate", "center")
+    for pk, title, feed, bedroom_count, usd_rate, center in rows.iterator(chunk_size=5000):
+        yield (pk, normalize_title(title), feed, bedroom_count, float(usd_rate), center.x, center.y)
+
+
+def score_blocks(blocks, workers=None, window=None):
+    """
+    Yield the scored pairs of every block. With more than one worker, at most ``window``
+    blocks are in flight at a time, so neither pending blocks nor results pile up in memory.
+    """
+    if workers == 1:
+        for block in blocks:
+            yield from _score_block(block)
+        return
+
+    window = window or 4 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for block in blocks:
+            pending.add(executor.submit(_score_block, block))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        for future in pending:
+            yield from future.result()
+
+
+def find_duplicate_candidates(queryset=None, max_distance=150, min_score=0.75,
+                              cross_feed_only=True, workers=None, limit=None):
+    """
+    Return likely duplicate accommodations as dicts ranked by score (highest first).
+    Only pairs within ``max_distance`` meters of each other are compared, and cells
+    are scored in parallel by ``workers`` processes (1 runs in-process). With ``limit``
+    only the best pairs seen so far are kept while scoring.
+    """
+    if queryset is None:
+        queryset = Accommodation.objects.all()
+    blocks = build_blocks(load_rows(queryset), max_distance, min_score, cross_feed_only)
+    pairs = score_blocks(blocks, workers)
+
+    rank = lambda pair: (-pair[0], pair[3], pair[1], pair[2])
+    pairs = heapq.nsmallest(limit, pairs, key=rank) if limit else sorted(pairs, key=rank)
+    return [
+        {"score": score, "accommodation_id": first, "duplicate_id": second, "distance_m": distance}
+        for score, first, second, distance in pairs
+    ]
@@ -0,0 +1,141 @@
+import random
+import time
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from location.models import Location, Accommodation, ChangeLogEntry, LocationSubtreeOperation
+from location.rollups import recompute_location_counts
+from location.subtree import run_subtree_operation
+
+BENCH_PREFIX = "BENCH"
+
+# The access-path indexes added by migration 0006; the comparison runs once without them.
+ACCESS_PATH_INDEXES = [
+    "acc_created_idx", "acc_user_created_idx", "acc_published_created_idx",
+    "acc_pub_country_idx", "acc_pub_location_idx",
+]
+
+class Command(BaseCommand):
+    help = (
+        "Print EXPLAIN ANALYZE plans and timings for the main Accommodation access paths, first without "
+        "the access-path indexes (dropped inside a transaction that is rolled back), then with them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="First generate this many synthetic accommodations")
+        parser.add_argument("--cleanup", action="store_true", help="Delete the synthetic dataset and exit")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The benchmark compares PostgreSQL plans.")
+
+        if options["cleanup"]:
+            self.cleanup()
+            return
+
+        if options["seed"]:
+            self.seed(options["seed"])
+
+        # DROP INDEX is transactional in PostgreSQL: the plans below see the table without the
+        # indexes, and the rollback restores them. Writers to the table wait until then.
+        with transaction.atomic():
+            with connection.schema_editor() as editor:
+                for index in Accommodation._meta.indexes:
+                    if index.name in ACCESS_PATH_INDEXES:
+                        editor.remove_index(Accommodation, index)
+            self.stdout.write(self.style.MIGRATE_HEADING("=== Without the access-path indexes ===\n"))
+            self.run_queries(options["repeat"])
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.MIGRATE_HEADING("=== With the access-path indexes ===\n"))
+        self.run_queries(options["repeat"])
+
+    def run_queries(self, repeat):
+        for label, queryset in self.queries():
+            plan = queryset.explain(analyze=True, buffers=True)
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset)
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{label}: best {min(timings):.2f} ms of {repeat}"))
+            self.stdout.write(plan + "\n")
+
+    def queries(self):
+        """Representative queries for the admin changelist, owner view and public listings."""
+        city = Location.objects.filter(location_type="city").order_by("pk").first()
+        owner = User.objects.order_by("pk").first()
+        published = Accommodation.objects.filter(published=True)
+        return [
+            ("Admin changelist (-created_at)", Accommodation.objects.order_by("-created_at")[:100]),
+            ("Owner changelist (user, -created_at)", Accommodation.objects.filter(user=owner).order_by("-created_at")[:100]),
+            ("Admin filter published", Accommodation.objects.filter(published=False).order_by("-created_at")[:100]),
+            ("Published by country", published.filter(country_code="BD").order_by("-created_at")[:50]),
+            ("Published by location", published.filter(location=city).order_by("-created_at")[:50]),
+        ]
+
+    def seed(self, count, batch_size=5000):
+        """Generate a synthetic dataset spread over a few countries, cities, owners and feeds."""
+        countries = ["BD", "IN", "US", "DE", "FR", "BR", "JP", "AU"]
+        cities = []
+        for code in countries:
+            country = Location.objects.update_or_create(
+                id=f"{BENCH_PREFIX}-{code}",
+                defaults={"title": code, "center": Point(0, 0), "location_type": "country", "country_code": code},
+            )[0]
+            for i in range(25):
+                cities.append(Location.objects.update_or_create(
+                    id=f"{BENCH_PREFIX}-{code}-{i}",
+                    defaults={
+                        "title": f"{code} City {i}", "center": Point(random.uniform(-180, 180), random.uniform(-60, 60)),
+                        "location_type": "city", "country_code": code, "parent": country,
+                    },
+                )[0])
+        owners = list(User.objects.all()[:20]) or [None]
+
+        start = Accommodation.objects.filter(id__startswith=BENCH_PREFIX).count()
+        for offset in range(0, count, batch_size):
+            batch = []
+            for n in range(start + offset, start + min(offset + batch_size, count)):
+                city = random.choice(cities)
+                batch.append(Accommodation(
+                    id=f"{BENCH_PREFIX}{n}", title=f"Synthetic {n}", feed=random.randint(0, 5),
+                    country_code=city.country_code, bedroom_count=random.randint(1, 6),
+                    usd_rate=Decimal(random.randint(20, 900)), center=city.center,
+                    location=city, user=random.choice(owners), published=random.random() < 0.7,
+                ))
+            Accommodation.objects.bulk_create(batch)
+            self.stdout.write(f"Seeded {start + offset + len(batch)} synthetic accommodations")
+
+        # bulk_create skips the per-object rollup signals.
+        recompute_location_counts()
+
+    def cleanup(self):
+        """
+        Remove the synthetic countries with batched subtree operations. The seeded accommodations
+        were bulk-created without change-log entries, so delete tombstones of never-logged ones are dropped.
+        """
+        for country_id in Location.objects.filter(
+            id__startswith=BENCH_PREFIX, location_type="country"
+        ).values_list("id", flat=True):
+            run_subtree_operation(LocationSubtreeOperation.objects.create(
+                root_id=country_id, mode=LocationSubtreeOperation.DELETE, status=LocationSubtreeOperation.RUNNING,
+            ))
+
+        model = Accommodation._meta.label_lower
+        logged = ChangeLogEntry.objects.filter(
+            model=model, object_id=OuterRef("object_id"), action=ChangeLogEntry.UPSERT
+        )
+        tombstones = ChangeLogEntry.objects.filter(
+            model=model, object_id__startswith=BENCH_PREFIX, action=ChangeLogEntry.DELETE
+        ).exclude(Exists(logged)).order_by("id").values_list("id", flat=True)
+        while True:
+            ids = list(tombstones[:5000])
+            if not ids:
+                break
+            ChangeLogEntry.objects.filter(id__in=ids).delete()
+        self.stdout.write(self.style.SUCCESS("Synthetic dataset removed."))
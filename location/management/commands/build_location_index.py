@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from location.spatial_index import LocationIndex
+
+class Command(BaseCommand):
+    help = "Snapshot the in-memory Location spatial index to a directory of memory-mappable .npy files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default="location_index", help="Snapshot directory")
+        parser.add_argument("--types", nargs="*", default=["city"], help="Location types to index (none for all)")
+        parser.add_argument("--cell-size", type=int, default=50_000, help="Grid cell size in meters")
+        parser.add_argument("--refresh", action="store_true", help="Update an existing snapshot from updated_at deltas")
+
+    def handle(self, *args, **options):
+        if options["refresh"]:
+            index = LocationIndex.load(options["output"], mmap=False)
+            changed = index.refresh()
+            self.stdout.write(f"{changed} changed locations applied.")
+        else:
+            index = LocationIndex.from_db(options["types"], cell_size_m=options["cell_size"])
+
+        index.save(options["output"])
+        self.stdout.write(self.style.SUCCESS(f"Location index with {len(index)} points written to {options['output']}"))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from location.changelog import compact_change_log, CHANGE_LOG_COMPACT_AFTER, CHANGE_LOG_RETENTION
+
+class Command(BaseCommand):
+    help = "Compact the change log to the latest entry per object and drop expired delete tombstones"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--compact-after-hours", type=float, default=CHANGE_LOG_COMPACT_AFTER.total_seconds() / 3600
+        )
+        parser.add_argument("--retention-days", type=float, default=CHANGE_LOG_RETENTION.total_seconds() / 86400)
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        removed = compact_change_log(
+            compact_after=timedelta(hours=options["compact_after_hours"]),
+            retention=timedelta(days=options["retention_days"]),
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"{removed} change log entries removed."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from location.models import Location, LocationSubtreeOperation
+from location.subtree import claim_operation, run_subtree_operation, SUBTREE_BATCH_SIZE
+
+class Command(BaseCommand):
+    help = (
+        "Delete (or archive) Locations and everything below them in short batched transactions. "
+        "Without location ids, resumes queued and interrupted operations; operations are claimed "
+        "atomically, so several runners can work side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("location_ids", nargs="*")
+        parser.add_argument("--archive", action="store_true", help="Move rows to the archive instead of deleting")
+        parser.add_argument("--batch-size", type=int, default=SUBTREE_BATCH_SIZE)
+        parser.add_argument(
+            "--retry", action="store_true",
+            help="Without location ids, also resume failed operations where they stopped",
+        )
+
+    def handle(self, *args, **options):
+        if options["location_ids"]:
+            missing = set(options["location_ids"]) - set(
+                Location.objects.filter(pk__in=options["location_ids"]).values_list("pk", flat=True)
+            )
+            if missing:
+                raise CommandError(f"Unknown locations: {', '.join(sorted(missing))}")
+            mode = LocationSubtreeOperation.ARCHIVE if options["archive"] else LocationSubtreeOperation.DELETE
+            # Created already claimed, so a concurrent runner does not pick them up.
+            operations = [
+                LocationSubtreeOperation.objects.create(
+                    root_id=location_id, mode=mode, status=LocationSubtreeOperation.RUNNING
+                )
+                for location_id in options["location_ids"]
+            ]
+        else:
+            operations = iter(lambda: claim_operation(retry_failed=options["retry"]), None)
+
+        for operation in operations:
+            run_subtree_operation(operation, batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(
+                f"{operation}: {operation.locations_removed} locations, "
+                f"{operation.accommodations_removed} accommodations removed."
+            ))
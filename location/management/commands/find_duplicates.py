@@ -0,0 +1,35 @@
+import json
+from django.core.management.base import BaseCommand
+from location.dedup import find_duplicate_candidates
+from location.models import Accommodation
+
+class Command(BaseCommand):
+    help = "Find likely duplicate accommodations across feeds and write a ranked candidate-pair report"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--distance", type=float, default=150, help="Max distance in meters between duplicates")
+        parser.add_argument("--min-score", type=float, default=0.75, help="Minimum pair score (0-1) to report")
+        parser.add_argument("--workers", type=int, default=None, help="Worker processes (defaults to CPU count)")
+        parser.add_argument("--country-code", help="Only compare accommodations in this country")
+        parser.add_argument("--same-feed", action="store_true", help="Also compare accommodations from the same feed")
+        parser.add_argument("--limit", type=int, default=None)
+        parser.add_argument("--output", default="duplicates.json")
+
+    def handle(self, *args, **options):
+        queryset = Accommodation.objects.all()
+        if options["country_code"]:
+            queryset = queryset.filter(country_code=options["country_code"].upper())
+
+        candidates = find_duplicate_candidates(
+            queryset,
+            max_distance=options["distance"],
+            min_score=options["min_score"],
+            cross_feed_only=not options["same_feed"],
+            workers=options["workers"],
+            limit=options["limit"],
+        )
+
+        with open(options["output"], "w") as f:
+            json.dump(candidates, f, indent=4)
+
+        self.stdout.write(self.style.SUCCESS(f"{len(candidates)} candidate pairs written to {options['output']}"))
@@ -19,6 +19,7 @@ class Command(BaseCommand):
         for country in countries:
             country_data = {
                 country.title: country.id.lower(),
+                **self.get_counts(country),
                 "locations": self.get_child_locations(country)
             }
             sitemap.append(country_data)
@@ -41,12 +42,23 @@ class Command(BaseCommand):
             if child.location_type == "state":
                 state_data = {
                     child.title: f"{parent_location.id.lower()}/{child.id.lower()}",
+                    **self.get_counts(child),
                     "locations": self.get_child_locations(child)
                 }
                 child_list.append(state_data)
             else:  # City or leaf location
                 child_list.append({
-                    child.title: f"{parent_location.id.lower()}/{child.id.lower()}"
+                    child.title: f"{parent_location.id.lower()}/{child.id.lower()}",
+                    **self.get_counts(child)
                 })
 
         return child_list
+
+    def get_counts(self, location):
+        """
+        Accommodation counts for a location, including all of its children.
+        """
+        return {
+            "accommodation_count": location.accommodation_count,
+            "published_count": location.published_count,
+        }
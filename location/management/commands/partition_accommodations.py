@@ -0,0 +1,142 @@
+import re
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from location.models import Accommodation
+
+CONSEQUENCES = (
+    "Accommodation.id is no longer unique in the database: the primary key becomes (id, {column}) "
+    "and the foreign keys from {referencing} to accommodations are dropped, so only Django code "
+    "keeps ids unique and cascades deletes.",
+    "The migration state no longer matches the schema: Django still believes those foreign keys exist, "
+    "so a later migration that alters them (AlterField) will fail. Before such a migration, set "
+    "db_constraint=False on those ForeignKeys and apply the generated migration with "
+    "'migrate location --fake', or wrap the change in SeparateDatabaseAndState.",
+)
+
+class Command(BaseCommand):
+    help = (
+        "Opt-in: convert the accommodation table into a table declaratively partitioned "
+        "by country_code or feed once it passes a size threshold (PostgreSQL only)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--by", choices=["country_code", "feed"], default="country_code")
+        parser.add_argument(
+            "--threshold", type=int,
+            default=getattr(settings, "ACCOMMODATION_PARTITION_THRESHOLD", 5_000_000),
+            help="Only partition when the table has at least this many rows",
+        )
+        parser.add_argument("--force", action="store_true", help="Ignore the size threshold")
+        parser.add_argument("--execute", action="store_true", help="Run the SQL instead of printing it")
+        parser.add_argument("--keep-old", action="store_true", help="Keep the unpartitioned table as <table>_old")
+        parser.add_argument(
+            "--accept-non-unique-ids", action="store_true",
+            help="Required with --execute: acknowledge that ids are no longer unique and migrations drift (see the dry run)",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Declarative partitioning requires PostgreSQL.")
+
+        table = Accommodation._meta.db_table
+        column = options["by"]
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind, reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+            relkind, estimated_rows = cursor.fetchone()
+            if relkind == "p":
+                self.stdout.write(f"{table} is already partitioned.")
+                return
+            if estimated_rows < options["threshold"] and not options["force"]:
+                self.stdout.write(
+                    f"{table} has ~{estimated_rows} rows, below the threshold of {options['threshold']}; nothing to do."
+                )
+                return
+            statements = self.build_statements(cursor, table, column, options["keep_old"])
+
+        referencing = ", ".join(
+            sorted(related.related_model._meta.db_table for related in Accommodation._meta.related_objects)
+        )
+        consequences = [text.format(column=column, referencing=referencing) for text in CONSEQUENCES]
+
+        if not options["execute"]:
+            for sql, params in statements:
+                self.stdout.write(connection.ops.compose_sql(sql, params) + ";")
+            for text in consequences:
+                self.stdout.write(self.style.WARNING(f"-- {text}"))
+            self.stdout.write(self.style.WARNING("Dry run; pass --execute --accept-non-unique-ids to apply."))
+            return
+
+        if not options["accept_non_unique_ids"]:
+            raise CommandError(" ".join(consequences) + " Pass --accept-non-unique-ids to proceed.")
+
+        # One transaction: run it in a maintenance window, writers block until it commits.
+        with transaction.atomic(), connection.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute(sql, params)
+
+        self.stdout.write(self.style.SUCCESS(f"{table} is now partitioned by {column}."))
+
+    def build_statements(self, cursor, table, column, keep_old):
+        """
+        SQL to swap the table for a partitioned copy. PostgreSQL requires the partition key
+        in the primary key, so the PK becomes (id, <column>) and the database-level foreign
+        keys pointing at accommodation ids are dropped; Django still enforces CASCADE itself.
+        """
+        quote = connection.ops.quote_name
+        old_table = f"{table}_old"
+
+        cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s", [table])
+        indexes = cursor.fetchall()
+        primary_key = f"{table}_pkey"
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE confrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        referencing_fks = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        outgoing_fks = cursor.fetchall()
+        cursor.execute(f"SELECT DISTINCT {quote(column)} FROM {quote(table)} ORDER BY 1")
+        values = [row[0] for row in cursor.fetchall()]
+
+        statements = [(f"ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}", [])]
+        for name, _ in indexes:
+            statements.append((f"ALTER INDEX {quote(name)} RENAME TO {quote(name[:59] + '_old')}", []))
+        for referencing_table, constraint in referencing_fks:
+            statements.append((f"ALTER TABLE {referencing_table} DROP CONSTRAINT {quote(constraint)}", []))
+
+        statements += [
+            (
+                f"CREATE TABLE {quote(table)} (LIKE {quote(old_table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                f"PARTITION BY LIST ({quote(column)})",
+                [],
+            ),
+            (f"ALTER TABLE {quote(table)} ADD PRIMARY KEY (id, {quote(column)})", []),
+        ]
+        for value in values:
+            suffix = re.sub(r"[^a-z0-9]", "_", str(value).lower())
+            statements.append((
+                f"CREATE TABLE {quote(f'{table}_{column}_{suffix}')} PARTITION OF {quote(table)} FOR VALUES IN (%s)",
+                [value],
+            ))
+        statements.append((f"CREATE TABLE {quote(f'{table}_default')} PARTITION OF {quote(table)} DEFAULT", []))
+
+        # Index definitions were captured before the rename, so they target the new table.
+        statements += [
+            (indexdef.replace("%", "%%"), []) for name, indexdef in indexes if name != primary_key
+        ]
+        statements += [
+            (f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition.replace('%', '%%')}", [])
+            for name, definition in outgoing_fks
+        ]
+        statements.append((f"INSERT INTO {quote(table)} SELECT * FROM {quote(old_table)}", []))
+        statements.append((f"ANALYZE {quote(table)}", []))
+        if not keep_old:
+            statements.append((f"DROP TABLE {quote(old_table)}", []))
+        return statements
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from location.rollups import find_count_drift, recompute_location_counts
+
+class Command(BaseCommand):
+    help = "Recompute the rolled-up accommodation counts of every Location, or only report drift with --check"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Report drifted locations without fixing them")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drift = find_count_drift()
+            for location_id, stored, expected in drift:
+                self.stdout.write(f"{location_id}: stored {stored}, expected {expected}")
+            if drift:
+                raise CommandError(f"{len(drift)} locations have drifted counts.")
+            self.stdout.write(self.style.SUCCESS("All location counts are up to date."))
+            return
+
+        fixed = recompute_location_counts(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Recomputed counts; {fixed} locations updated."))
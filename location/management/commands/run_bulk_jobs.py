@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from location.bulk import claim_job, run_job, BULK_ACTION_CHUNK_SIZE
+
+class Command(BaseCommand):
+    help = (
+        "Process queued bulk accommodation jobs in chunks (resumes interrupted jobs; "
+        "pass --job to retry a failed one). Jobs are claimed atomically, so several runners "
+        "can work side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=BULK_ACTION_CHUNK_SIZE)
+        parser.add_argument("--job", type=int, help="Only process the job with this id (also resumes it if it failed)")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_job(options["job"])
+            if job is None:
+                break
+            try:
+                run_job(job, chunk_size=options["chunk_size"])
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"Job #{job.pk} failed: {e}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"Job #{job.pk}: {job.processed}/{job.total} accommodations processed."))
+            if options["job"]:
+                break
@@ -0,0 +1,25 @@
+import sys
+from django.core.management.base import BaseCommand
+from location.changelog import cursor_of, iter_changes, to_ndjson, CHANGE_FEED_BATCH_SIZE
+
+class Command(BaseCommand):
+    help = "Write change-log entries after a cursor as NDJSON (one JSON object per line)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--after", default="0", help="Cursor of the last entry already consumed")
+        parser.add_argument("--limit", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=CHANGE_FEED_BATCH_SIZE)
+        parser.add_argument("--output", help="File to write to (defaults to stdout)")
+
+    def handle(self, *args, **options):
+        out = open(options["output"], "w") if options["output"] else sys.stdout
+        count, cursor = 0, options["after"]
+        try:
+            for entry in iter_changes(options["after"], options["limit"], options["batch_size"]):
+                out.write(to_ndjson(entry))
+                count, cursor = count + 1, cursor_of(entry)
+        finally:
+            if options["output"]:
+                out.close()
+
+        self.stderr.write(f"{count} changes written; next cursor {cursor}")
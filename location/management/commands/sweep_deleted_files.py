@@ -0,0 +1,22 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from location.models import PendingFileDeletion
+
+class Command(BaseCommand):
+    help = "Remove storage files of deleted accommodation images in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        removed = 0
+        while True:
+            batch = list(PendingFileDeletion.objects.order_by("pk")[:options["batch_size"]])
+            if not batch:
+                break
+            for pending in batch:
+                default_storage.delete(pending.name)
+            PendingFileDeletion.objects.filter(pk__in=[pending.pk for pending in batch]).delete()
+            removed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"{removed} files removed."))
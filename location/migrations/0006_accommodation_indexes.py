@@ -0,0 +1,39 @@
+# Generated by Django 5.1.3 on 2026-10-19 11:40
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Build the indexes without blocking writes on a populated table.
+    atomic = False
+
+    dependencies = [
+        ('location', '0005_bulkaccommodationjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='accommodation',
+            index=models.Index(fields=['-created_at'], name='acc_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='accommodation',
+            index=models.Index(fields=['user', '-created_at'], name='acc_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='accommodation',
+            index=models.Index(fields=['published', '-created_at'], name='acc_published_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='accommodation',
+            index=models.Index(condition=models.Q(('published', True)), fields=['country_code', '-created_at'], name='acc_pub_country_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='accommodation',
+            index=models.Index(condition=models.Q(('published', True)), fields=['location', '-created_at'], name='acc_pub_location_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.3 on 2026-10-19 14:05
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_counts(apps, schema_editor):
+    """
+    Fill the counts from one GROUP BY over accommodations and one pass over the parent links.
+    Kept self-contained so later changes to location.rollups cannot break this migration.
+    """
+    Location = apps.get_model('location', 'Location')
+    Accommodation = apps.get_model('location', 'Accommodation')
+
+    parents = dict(Location.objects.values_list('id', 'parent_id').iterator(chunk_size=5000))
+    counts = {location_id: [0, 0] for location_id in parents}
+    direct = (
+        Accommodation.objects.order_by()
+        .values('location_id')
+        .annotate(total=Count('pk'), published=Count('pk', filter=Q(published=True)))
+    )
+    for row in direct.iterator(chunk_size=5000):
+        location_id, seen = row['location_id'], set()
+        while location_id in counts and location_id not in seen:
+            seen.add(location_id)
+            counts[location_id][0] += row['total']
+            counts[location_id][1] += row['published']
+            location_id = parents[location_id]
+
+    batch = [
+        Location(id=location_id, accommodation_count=total, published_count=published)
+        for location_id, (total, published) in counts.items()
+        if total or published
+    ]
+    Location.objects.bulk_update(batch, ['accommodation_count', 'published_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0006_accommodation_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='accommodation_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='published_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
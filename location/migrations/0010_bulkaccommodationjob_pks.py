@@ -0,0 +1,22 @@
+# Generated by Django 5.1.3 on 2026-10-20 09:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0009_changelogentry'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='bulkaccommodationjob',
+            name='query',
+        ),
+        migrations.AddField(
+            model_name='bulkaccommodationjob',
+            name='pks',
+            field=models.JSONField(default=list),
+        ),
+    ]
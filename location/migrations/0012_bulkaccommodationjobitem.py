@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-21 09:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0011_changelogentry_xid'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='bulkaccommodationjob',
+            name='pks',
+        ),
+        migrations.CreateModel(
+            name='BulkAccommodationJobItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accommodation_id', models.CharField(max_length=20)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='location.bulkaccommodationjob')),
+            ],
+            options={
+                'verbose_name': 'Bulk Accommodation Job Item',
+                'verbose_name_plural': 'Bulk Accommodation Job Items',
+                'constraints': [models.UniqueConstraint(fields=('job', 'accommodation_id'), name='bulk_job_item_unique')],
+            },
+        ),
+    ]
@@ -2,7 +2,9 @@ import os
 import json
 from uuid import uuid4
 from decimal import Decimal
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Cast
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.gis.db import models as geomodels  # For spatial fields
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -45,7 +47,21 @@ def upload_accommodation_image(instance, filename):
 
 ### Models
 
-class Location(models.Model):
+class ChangeLoggedModel(models.Model):
+    """
+    Abstract base for models mirrored to downstream consumers. Saves run in a transaction
+    so the ChangeLogEntry written by the post_save receiver commits together with the row.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class Location(ChangeLoggedModel):
     """
     Location model for storing hierarchical geographic data.
     """
@@ -63,9 +79,14 @@ class Location(models.Model):
     country_code = models.CharField(max_length=2)
     state_abbr = models.CharField(max_length=3, null=True, blank=True)
     city = models.CharField(max_length=30, null=True, blank=True)
+    # Denormalized counts including all descendant locations, kept up to date by location.signals.
+    accommodation_count = models.IntegerField(default=0, editable=False)
+    published_count = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    ROLLUP_FIELDS = ('accommodation_count', 'published_count')
+
     class Meta:
         verbose_name = "Location"
         verbose_name_plural = "Locations"
@@ -73,8 +94,27 @@ class Location(models.Model):
     def __str__(self):
         return f"{self.title} ({self.location_type})"
 
+    def save(self, *args, **kwargs):
+        """
+        Never write the rolled-up counts from a possibly stale instance; they are updated with F() expressions.
+        A new instance whose id is already stored updates that row too, so it gets the same treatment.
+        """
+        overwrites = self._state.adding and not kwargs.get('force_insert') and (
+            Location.objects.filter(pk=self.pk).exists()
+        )
+        if (overwrites or not self._state.adding) and kwargs.get('update_fields') is None:
+            skipped = set(self.ROLLUP_FIELDS) | self.get_deferred_fields()
+            if overwrites:
+                # The stored row keeps its creation time; a fresh instance has none to write.
+                skipped |= {field.name for field in self._meta.concrete_fields if getattr(field, 'auto_now_add', False)}
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped and field.name not in skipped
+            ]
+        super().save(*args, **kwargs)
+
 
-class Accommodation(models.Model):
+class Accommodation(ChangeLoggedModel):
     """
     Accommodation model to store details of various properties.
     """
@@ -99,12 +139,27 @@ class Accommodation(models.Model):
     class Meta:
         verbose_name = "Accommodation"
         verbose_name_plural = "Accommodations"
+        indexes = [
+            # Admin changelist ordering and the Property Owners filter in get_queryset.
+            models.Index(fields=['-created_at'], name='acc_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='acc_user_created_idx'),
+            models.Index(fields=['published', '-created_at'], name='acc_published_created_idx'),
+            # Public listings only ever read published rows, so keep those indexes small.
+            models.Index(
+                fields=['country_code', '-created_at'], name='acc_pub_country_idx',
+                condition=models.Q(published=True),
+            ),
+            models.Index(
+                fields=['location', '-created_at'], name='acc_pub_location_idx',
+                condition=models.Q(published=True),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.location.title}"
 
 
-class AccommodationImage(models.Model):
+class AccommodationImage(ChangeLoggedModel):
     """
     Image model for Accommodation.
     """
@@ -118,7 +173,7 @@ class AccommodationImage(models.Model):
         return f"Image for {self.accommodation.title}"
 
 
-class LocalizeAccommodation(models.Model):
+class LocalizeAccommodation(ChangeLoggedModel):
     """
     Localized details for Accommodation, supporting multiple languages.
     """
@@ -136,3 +191,173 @@ class LocalizeAccommodation(models.Model):
 
     def __str__(self):
         return f"{self.accommodation.title} - {self.language}"
+
+
+class BulkAccommodationJob(models.Model):
+    """
+    Background job applying a bulk admin action to a (possibly very large) Accommodation selection.
+    """
+    PUBLISH = 'publish'
+    UNPUBLISH = 'unpublish'
+    REASSIGN = 'reassign'
+    DELETE = 'delete'
+    ACTION_CHOICES = [
+        (PUBLISH, 'Publish'),
+        (UNPUBLISH, 'Unpublish'),
+        (REASSIGN, 'Reassign location'),
+        (DELETE, 'Delete'),
+    ]
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    last_pk = models.CharField(max_length=20, null=True, blank=True)  # Last processed pk
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Bulk Accommodation Job"
+        verbose_name_plural = "Bulk Accommodation Jobs"
+
+    def __str__(self):
+        return f"{self.get_action_display()} #{self.pk} ({self.status})"
+
+    @property
+    def progress(self):
+        """Percentage of the selection processed so far."""
+        if not self.total:
+            return 100 if self.status == self.DONE else 0
+        return min(100, round(self.processed * 100 / self.total))
+
+
+class BulkAccommodationJobItem(models.Model):
+    """
+    One selected accommodation of a BulkAccommodationJob, copied set-based when the job is queued.
+    A plain id rather than a foreign key, so deleted accommodations do not take their row along.
+    """
+    job = models.ForeignKey(BulkAccommodationJob, on_delete=models.CASCADE, related_name='items')
+    accommodation_id = models.CharField(max_length=20)
+
+    class Meta:
+        verbose_name = "Bulk Accommodation Job Item"
+        verbose_name_plural = "Bulk Accommodation Job Items"
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'accommodation_id'], name='bulk_job_item_unique'),
+        ]
+
+    def __str__(self):
+        return f"Job #{self.job_id}: {self.accommodation_id}"
+
+
+class LocationSubtreeOperation(models.Model):
+    """
+    Resumable, batched delete or archive of a Location and everything below it.
+    """
+    DELETE = 'delete'
+    ARCHIVE = 'archive'
+    MODE_CHOICES = [(DELETE, 'Delete'), (ARCHIVE, 'Archive')]
+
+    PENDING = BulkAccommodationJob.PENDING
+    RUNNING = BulkAccommodationJob.RUNNING
+    DONE = BulkAccommodationJob.DONE
+    FAILED = BulkAccommodationJob.FAILED
+
+    root_id = models.CharField(max_length=20)  # Not a FK: the root itself is removed last
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES, default=DELETE)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    status = models.CharField(max_length=10, choices=BulkAccommodationJob.STATUS_CHOICES, default=PENDING)
+    accommodations_removed = models.PositiveIntegerField(default=0)
+    locations_removed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Location Subtree Operation"
+        verbose_name_plural = "Location Subtree Operations"
+
+    def __str__(self):
+        return f"{self.get_mode_display()} {self.root_id} ({self.status})"
+
+
+class ArchivedRecord(models.Model):
+    """
+    Row moved out of a live table by a subtree archive, stored as its JSON column values.
+    """
+    operation = models.ForeignKey(LocationSubtreeOperation, on_delete=models.SET_NULL, null=True, related_name='archived_records')
+    model = models.CharField(max_length=100)  # app_label.model_name
+    object_id = models.CharField(max_length=20)
+    data = models.JSONField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Archived Record"
+        verbose_name_plural = "Archived Records"
+        indexes = [models.Index(fields=['model', 'object_id'], name='archived_model_object_idx')]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+
+class PendingFileDeletion(models.Model):
+    """
+    Storage file whose database row is gone; removed later by the sweep_deleted_files command.
+    """
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Append-only outbox of changes to locations and accommodations. Entries are consumed in
+    (xid, id) order, and only from transactions older than every running one, so an entry
+    committed late can never land behind a consumer's cursor.
+    """
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTION_CHOICES = [(UPSERT, 'Upsert'), (DELETE, 'Delete')]
+
+    id = models.BigAutoField(primary_key=True)
+    # Id of the inserting transaction (PostgreSQL 13+); xid8 only casts to bigint through text.
+    xid = models.BigIntegerField(
+        db_default=Cast(
+            Cast(models.Func(function='pg_current_xact_id', output_field=models.TextField()), models.TextField()),
+            models.BigIntegerField(),
+        ),
+        editable=False,
+    )
+    model = models.CharField(max_length=100)  # app_label.model_name
+    object_id = models.CharField(max_length=20)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)  # Field values after an upsert
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Change Log Entry"
+        verbose_name_plural = "Change Log Entries"
+        indexes = [
+            models.Index(fields=['xid', 'id'], name='changelog_cursor_idx'),
+            models.Index(fields=['model', 'object_id', 'id'], name='changelog_key_idx'),
+            models.Index(fields=['created_at'], name='changelog_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.action} {self.model} {self.object_id}"
@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from .models import Location, Accommodation
+
+
+_suspended = ContextVar('location_rollups_suspended', default=False)
+
+
+@contextmanager
+def suspended():
+    """Skip per-object counter updates, for set-based code that refreshes counts once per batch."""
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+def is_suspended():
+    return _suspended.get()
+
+
+def ancestor_ids(location_id):
+    """The location itself followed by its parent, grandparent, ... up to the root."""
+    ids = []
+    while location_id and location_id not in ids:
+        ids.append(location_id)
+        location_id = Location.objects.filter(pk=location_id).values_list('parent_id', flat=True).first()
+    return ids
+
+
+def apply_delta(location_id, total=0, published=0):
+    """Add to the rolled-up counts of a location and all of its ancestors in one UPDATE."""
+    if not location_id or (not total and not published):
+        return
+    Location.objects.filter(pk__in=ancestor_ids(location_id)).update(
+        accommodation_count=F('accommodation_count') + total,
+        published_count=F('published_count') + published,
+    )
+
+
+def refresh_location_counts(location_ids):
+    """
+    Re-derive the counts of accommodations attached directly to each location and
+    propagate any difference to its ancestors. The stored direct count is the node's
+    rollup minus its children's rollups, so the result does not depend on processing order.
+    The node row stays locked from reading its counts until the delta is applied, so two
+    concurrent refreshes of the same location cannot both add the same difference.
+    """
+    for location_id in location_ids:
+        with transaction.atomic():
+            node = (
+                Location.objects.select_for_update().filter(pk=location_id)
+                .values('accommodation_count', 'published_count').first()
+            )
+            if node is None:
+                continue
+            direct = Accommodation.objects.filter(location_id=location_id).aggregate(
+                total=Count('pk'), published=Count('pk', filter=Q(published=True))
+            )
+            children = Location.objects.filter(parent_id=location_id).aggregate(
+                total=Coalesce(Sum('accommodation_count'), 0), published=Coalesce(Sum('published_count'), 0)
+            )
+            apply_delta(
+                location_id,
+                total=direct['total'] - (node['accommodation_count'] - children['total']),
+                published=direct['published'] - (node['published_count'] - children['published']),
+            )
+
+
+def compute_location_counts():
+    """
+    Expected {location_id: (accommodation_count, published_count)} for every location,
+    from one GROUP BY over accommodations and one pass over the parent links.
+    """
+    parents = dict(Location.objects.values_list('id', 'parent_id').iterator(chunk_size=5000))
+    counts = {location_id: [0, 0] for location_id in parents}
+
+    direct = (
+        Accommodation.objects.order_by()
+        .values('location_id')
+        .annotate(total=Count('pk'), published=Count('pk', filter=Q(published=True)))
+    )
+    for row in direct.iterator(chunk_size=5000):
+        location_id, seen = row['location_id'], set()
+        while location_id in counts and location_id not in seen:
+            seen.add(location_id)
+            counts[location_id][0] += row['total']
+            counts[location_id][1] += row['published']
+            location_id = parents[location_id]
+
+    return {location_id: tuple(value) for location_id, value in counts.items()}
+
+
+def find_count_drift():
+    """Locations whose stored counts differ from the expected ones, as (id, stored, expected) tuples."""
+    expected = compute_location_counts()
+    stored = Location.objects.values_list('id', 'accommodation_count', 'published_count')
+    return [
+        (location_id, (total, published), expected[location_id])
+        for location_id, total, published in stored.iterator(chunk_size=5000)
+        if location_id in expected and (total, published) != expected[location_id]
+    ]
+
+
+def recompute_location_counts(batch_size=1000):
+    """Rewrite the counts of drifted locations in batches; returns the number of locations fixed."""
+    drift = find_count_drift()
+    for start in range(0, len(drift), batch_size):
+        batch = []
+        for location_id, _, (total, published) in drift[start:start + batch_size]:
+            batch.append(Location(id=location_id, accommodation_count=total, published_count=published))
+        Location.objects.bulk_update(batch, ['accommodation_count', 'published_count'])
+    return len(drift)
@@ -0,0 +1,105 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import Signal, receiver
+from . import changelog, rollups
+from .models import Location, Accommodation, AccommodationImage, LocalizeAccommodation, BulkAccommodationJob, ChangeLogEntry
+
+
+# Sent once per batch by the set-based bulk operations, which bypass the
+# per-object save/delete signals. Receivers get ``action``, ``pks`` and the
+# ``location_ids`` touched by the batch (old and new locations on reassign).
+accommodations_bulk_changed = Signal()
+
+
+@receiver(post_init, sender=Accommodation)
+def remember_accommodation_state(sender, instance, **kwargs):
+    """Snapshot the fields that affect Location counts (without loading deferred fields)."""
+    state = (instance.__dict__.get('location_id'), instance.__dict__.get('published'))
+    instance._rollup_state = state if None not in state else None
+
+
+@receiver(pre_save, sender=Accommodation)
+def load_accommodation_state(sender, instance, **kwargs):
+    """New instances may still overwrite an existing row, so ask the database what is stored."""
+    if instance._state.adding or instance._rollup_state is None:
+        instance._rollup_state = (
+            Accommodation.objects.filter(pk=instance.pk).values_list('location_id', 'published').first()
+        )
+
+
+@receiver(post_save, sender=Accommodation)
+def update_counts_on_save(sender, instance, **kwargs):
+    """Move the accommodation's contribution from its old location/published state to the new one."""
+    old, new = instance._rollup_state, (instance.location_id, instance.published)
+    instance._rollup_state = new
+    if old == new or rollups.is_suspended():
+        return
+    if old and old[0] == new[0]:
+        rollups.apply_delta(new[0], published=int(new[1]) - int(old[1]))
+        return
+    if old:
+        rollups.apply_delta(old[0], total=-1, published=-int(old[1]))
+    rollups.apply_delta(new[0], total=1, published=int(new[1]))
+
+
+@receiver(post_delete, sender=Accommodation)
+def update_counts_on_delete(sender, instance, **kwargs):
+    if not rollups.is_suspended():
+        rollups.apply_delta(instance.location_id, total=-1, published=-int(instance.published))
+
+
+@receiver(post_init, sender=Location)
+def remember_location_parent(sender, instance, **kwargs):
+    instance._rollup_parent_id = instance.__dict__.get('parent_id')
+
+
+@receiver(pre_save, sender=Location)
+def load_location_parent(sender, instance, **kwargs):
+    """New instances may still overwrite an existing row, so ask the database for the stored parent."""
+    if instance._state.adding:
+        instance._rollup_parent_id = (
+            Location.objects.filter(pk=instance.pk).values_list('parent_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Location)
+def update_counts_on_reparent(sender, instance, created, **kwargs):
+    """A location moved to another parent takes its whole subtree's counts with it."""
+    old_parent_id, instance._rollup_parent_id = instance._rollup_parent_id, instance.parent_id
+    if created or old_parent_id == instance.parent_id or rollups.is_suspended():
+        return
+    total, published = Location.objects.filter(pk=instance.pk).values_list(
+        'accommodation_count', 'published_count'
+    ).get()
+    rollups.apply_delta(old_parent_id, total=-total, published=-published)
+    rollups.apply_delta(instance.parent_id, total=total, published=published)
+
+
+@receiver(accommodations_bulk_changed)
+def refresh_counts_after_bulk_change(sender, location_ids, **kwargs):
+    rollups.refresh_location_counts(location_ids)
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Accommodation)
+@receiver(post_save, sender=AccommodationImage)
+@receiver(post_save, sender=LocalizeAccommodation)
+def log_save(sender, instance, raw=False, **kwargs):
+    """Runs inside ChangeLoggedModel.save()'s transaction."""
+    if not raw:
+        changelog.record_change(instance, ChangeLogEntry.UPSERT)
+
+
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Accommodation)
+@receiver(post_delete, sender=AccommodationImage)
+@receiver(post_delete, sender=LocalizeAccommodation)
+def log_delete(sender, instance, **kwargs):
+    """The deletion collector sends post_delete inside its own transaction."""
+    changelog.record_change(instance, ChangeLogEntry.DELETE)
+
+
+@receiver(accommodations_bulk_changed)
+def log_bulk_change(sender, action, pks, **kwargs):
+    # Bulk deletes go through the collector, which already logged each row via post_delete.
+    if action != BulkAccommodationJob.DELETE:
+        changelog.record_upserts(Accommodation.objects.filter(pk__in=pks))
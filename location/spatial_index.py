@@ -0,0 +1,290 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Location
+
+
+EARTH_RADIUS_M = 6371008.8
+
+# A lookup wider than this many cells in each direction compares against every point instead.
+MAX_GRID_SPAN = 2
+
+# How far the refresh watermark trails the read. ``updated_at`` is set before the saving transaction
+# commits, so a row committed up to this long after its save is still picked up by the next refresh.
+LOCATION_INDEX_OVERLAP = getattr(settings, 'LOCATION_INDEX_OVERLAP', timedelta(minutes=10))
+
+
+def to_unit_vectors(lons, lats):
+    """Lon/lat degrees to (n, 3) points on the unit sphere, where chord length orders great-circle distance."""
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    cos_lats = np.cos(lats)
+    return np.column_stack((cos_lats * np.cos(lons), cos_lats * np.sin(lons), np.sin(lats)))
+
+
+def chord_to_meters(chord):
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def meters_to_chord(meters):
+    return 2 * np.sin(min(meters / EARTH_RADIUS_M, np.pi) / 2)
+
+
+class LocationIndex:
+    """
+    In-memory spatial index over Location.center for batched nearest-k and within-radius lookups.
+
+    Points are stored as unit vectors sorted by a uniform 3D grid cell, with a CSR-style
+    table of (cell key, start offset), so a lookup only scans the cells around each query.
+    The arrays can be saved to .npy files and memory-mapped, letting worker processes share
+    one copy through the page cache.
+    """
+
+    ARRAYS = ('ids', 'points', 'cell_keys', 'cell_starts')
+
+    def __init__(self, ids, lons, lats, cell_size_m=50_000, location_types=None, watermark=None):
+        self.cell_size_m = cell_size_m
+        self.location_types = list(location_types) if location_types else None
+        self.watermark = watermark
+        self._build(np.asarray(ids, dtype='<U20'), to_unit_vectors(lons, lats))
+
+    def __len__(self):
+        return len(self.ids)
+
+    ### Construction ###
+
+    def _build(self, ids, points):
+        self.cell = meters_to_chord(self.cell_size_m)
+        self.cells_per_axis = self._cells_per_axis(self.cell)
+        keys = self._cell_keys(self._cell_coords(points))
+        order = np.argsort(keys, kind='stable')
+        self.ids, self.points, keys = ids[order], points[order], keys[order]
+        self.cell_keys, self.cell_starts = np.unique(keys, return_index=True)
+        self.cell_starts = np.append(self.cell_starts, len(keys))
+
+    @staticmethod
+    def _cells_per_axis(cell):
+        # Coordinates span 2 / cell cells per axis, padded so neighbour lookups never wrap around.
+        return int(np.ceil(2 / cell)) + 1 + 2 * MAX_GRID_SPAN
+
+    def _cell_coords(self, points):
+        return np.floor((points + 1) / self.cell).astype(np.int64) + MAX_GRID_SPAN
+
+    def _cell_keys(self, coords):
+        n = self.cells_per_axis
+        return (coords[:, 0] * n + coords[:, 1]) * n + coords[:, 2]
+
+    @classmethod
+    def location_queryset(cls, location_types=None):
+        queryset = Location.objects.all()
+        if location_types:
+            queryset = queryset.filter(location_type__in=location_types)
+        return queryset
+
+    @classmethod
+    def from_db(cls, location_types=None, cell_size_m=50_000):
+        """Build the index from every Location (optionally only some location types)."""
+        watermark = timezone.now() - LOCATION_INDEX_OVERLAP
+        rows = cls.location_queryset(location_types).values_list('id', 'center').iterator(chunk_size=10000)
+        ids, lons, lats = [], [], []
+        for pk, center in rows:
+            ids.append(pk)
+            lons.append(center.x)
+            lats.append(center.y)
+        return cls(ids, lons, lats, cell_size_m, location_types, watermark)
+
+    def refresh(self):
+        """
+        Apply Locations changed since the last build/refresh (by ``updated_at``) and return the
+        number of index entries added, moved or removed. The watermark trails each read by
+        LOCATION_INDEX_OVERLAP, so rows saved in the overlap are read again: re-applying them
+        replaces their stale entries and does not count as a change. Deletions leave no
+        ``updated_at`` trace, so a row count mismatch afterwards triggers a full rebuild.
+        """
+        watermark = timezone.now() - LOCATION_INDEX_OVERLAP
+        rows = list(
+            Location.objects.filter(updated_at__gt=self.watermark)
+            .values_list('id', 'center', 'location_type')
+            .iterator(chunk_size=10000)
+        )
+        changes = 0
+        if rows:
+            stale = np.isin(self.ids, np.asarray([row[0] for row in rows], dtype='<U20'))
+            keep = [row for row in rows if not self.location_types or row[2] in self.location_types]
+            keep_ids = np.asarray([row[0] for row in keep], dtype='<U20')
+            keep_points = to_unit_vectors([row[1].x for row in keep], [row[1].y for row in keep]).reshape(-1, 3)
+
+            previous = dict(zip(self.ids[stale].tolist(), self.points[stale]))
+            changes = sum(
+                1 for pk, point in zip(keep_ids.tolist(), keep_points)
+                if pk not in previous or not np.array_equal(previous[pk], point)
+            ) + len(set(previous) - set(keep_ids.tolist()))
+            self._build(
+                np.concatenate((self.ids[~stale], keep_ids)),
+                np.concatenate((self.points[~stale], keep_points)),
+            )
+
+        if len(self) != self.location_queryset(self.location_types).count():
+            fresh = self.from_db(self.location_types, self.cell_size_m)
+            changes += np.setdiff1d(self.ids, fresh.ids).size + np.setdiff1d(fresh.ids, self.ids).size
+            self.__dict__.update(fresh.__dict__)
+            return changes
+
+        self.watermark = watermark
+        return changes
+
+    ### Snapshots ###
+
+    def save(self, path):
+        """
+        Write the arrays as .npy files plus a meta.json, exposed at ``path`` as a symlink to a
+        new sibling directory. The link is swapped with os.replace, so readers (and processes
+        that still have the previous snapshot memory-mapped) never see a half-written file.
+        """
+        path = os.path.abspath(path)
+        previous = os.path.realpath(path) if os.path.islink(path) else None
+        if os.path.exists(path) and previous is None:
+            raise FileExistsError(f"{path} exists and is not a snapshot link; remove it first.")
+
+        target = tempfile.mkdtemp(prefix=f'{os.path.basename(path)}.', dir=os.path.dirname(path))
+        for name in self.ARRAYS:
+            np.save(os.path.join(target, f'{name}.npy'), getattr(self, name))
+        meta = {
+            'cell_size_m': self.cell_size_m,
+            'location_types': self.location_types,
+            'watermark': self.watermark.isoformat() if self.watermark else None,
+        }
+        with open(os.path.join(target, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.chmod(target, 0o755)
+
+        link = f'{target}.link'
+        os.symlink(os.path.basename(target), link)
+        os.replace(link, path)
+        # Unlinked files stay readable through existing memory maps.
+        if previous and previous != target:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a snapshot; with ``mmap`` the arrays are read-only views of the files."""
+        # Resolve the link once so every file comes from the same snapshot, even if it is swapped meanwhile.
+        path = os.path.realpath(path)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        index = cls.__new__(cls)
+        index.cell_size_m = meta['cell_size_m']
+        index.location_types = meta['location_types']
+        index.watermark = parse_datetime(meta['watermark']) if meta['watermark'] else None
+        index.cell = meters_to_chord(index.cell_size_m)
+        index.cells_per_axis = cls._cells_per_axis(index.cell)
+        for name in cls.ARRAYS:
+            setattr(index, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r' if mmap else None))
+        return index
+
+    ### Lookups ###
+
+    def _candidate_pairs(self, queries, radius_m):
+        """(query index, point index, chord) for every point within ``radius_m`` of each query."""
+        chord = meters_to_chord(radius_m)
+        if not len(self):
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+        if self._uses_brute_force(radius_m):
+            return self._brute_force_pairs(queries, chord)
+
+        span = int(np.ceil(chord / self.cell))
+        coords = self._cell_coords(queries)
+        query_idx, point_idx = [], []
+        offsets = np.arange(-span, span + 1)
+        for dx in offsets:
+            for dy in offsets:
+                for dz in offsets:
+                    keys = self._cell_keys(coords + (dx, dy, dz))
+                    slots = np.searchsorted(self.cell_keys, keys)
+                    slots = np.minimum(slots, len(self.cell_keys) - 1)
+                    found = np.flatnonzero(self.cell_keys[slots] == keys)
+                    if not len(found):
+                        continue
+                    starts = self.cell_starts[slots[found]]
+                    lengths = self.cell_starts[slots[found] + 1] - starts
+                    query_idx.append(np.repeat(found, lengths))
+                    # Expand each [start, start + length) range into point indices.
+                    point_idx.append(
+                        np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+                    )
+        if not query_idx:
+            return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+        query_idx, point_idx = np.concatenate(query_idx), np.concatenate(point_idx)
+        chords = np.linalg.norm(self.points[point_idx] - queries[query_idx], axis=1)
+        within = chords <= chord
+        return query_idx[within], point_idx[within], chords[within]
+
+    def _uses_brute_force(self, radius_m):
+        return np.ceil(meters_to_chord(radius_m) / self.cell) > MAX_GRID_SPAN
+
+    def _brute_force_pairs(self, queries, chord, max_cells=10_000_000):
+        """Compare queries against all points, in query batches of bounded (batch x points) size."""
+        batch_size = max(1, max_cells // max(len(self), 1))
+        query_idx, point_idx, chords = [], [], []
+        for start in range(0, len(queries), batch_size):
+            # |a - b|^2 = 2 - 2 a.b for unit vectors.
+            dots = queries[start:start + batch_size] @ self.points.T
+            distances = np.sqrt(np.clip(2 - 2 * dots, 0, 4))
+            rows, cols = np.nonzero(distances <= chord)
+            query_idx.append(rows + start)
+            point_idx.append(cols)
+            chords.append(distances[rows, cols])
+        return np.concatenate(query_idx), np.concatenate(point_idx), np.concatenate(chords)
+
+    def within_radius(self, lons, lats, radius_m):
+        """
+        All indexed locations within ``radius_m`` meters of each query point, as flat arrays
+        (query index, location ids, distances in meters) sorted by query then distance.
+        """
+        queries = to_unit_vectors(lons, lats).reshape(-1, 3)
+        query_idx, point_idx, chords = self._candidate_pairs(queries, radius_m)
+        order = np.lexsort((chords, query_idx))
+        return query_idx[order], self.ids[point_idx[order]], chord_to_meters(chords[order])
+
+    def nearest(self, lons, lats, k=1):
+        """
+        The ``k`` nearest indexed locations to each query point, as (m, k) arrays of location ids
+        and distances in meters; missing neighbours are '' with an infinite distance.
+        """
+        queries = to_unit_vectors(lons, lats).reshape(-1, 3)
+        result_ids = np.full((len(queries), k), '', dtype='<U20')
+        result_distances = np.full((len(queries), k), np.inf)
+        if not len(self):
+            return result_ids, result_distances
+
+        pending = np.arange(len(queries))
+        radius_m = self.cell_size_m
+        while len(pending):
+            exhaustive = self._uses_brute_force(radius_m)
+            if exhaustive:
+                radius_m = np.pi * EARTH_RADIUS_M  # Half the circumference covers the whole sphere.
+            query_idx, point_idx, chords = self._candidate_pairs(queries[pending], radius_m)
+            found = np.bincount(query_idx, minlength=len(pending))
+            # k hits within the radius means the k nearest are all among them.
+            done = (found >= min(k, len(self))) | exhaustive
+
+            keep = done[query_idx]
+            query_idx, point_idx, chords = query_idx[keep], point_idx[keep], chords[keep]
+            order = np.lexsort((chords, query_idx))
+            query_idx, point_idx, chords = query_idx[order], point_idx[order], chords[order]
+            first = np.searchsorted(query_idx, query_idx)
+            rank = np.arange(len(query_idx)) - first
+            top = rank < k
+            rows = pending[query_idx[top]]
+            result_ids[rows, rank[top]] = self.ids[point_idx[top]]
+            result_distances[rows, rank[top]] = chord_to_meters(chords[top])
+
+            pending = pending[~done]
+            radius_m *= 2
+        return result_ids, result_distances
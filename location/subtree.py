@@ -0,0 +1,154 @@
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import bulk, rollups
+from .models import (
+    Location, Accommodation, AccommodationImage, LocalizeAccommodation,
+    ArchivedRecord, BulkAccommodationJob, LocationSubtreeOperation,
+)
+
+
+SUBTREE_BATCH_SIZE = 500
+
+# Locations with at most this many accommodations below them are removed inside the admin request.
+SUBTREE_SYNC_LIMIT = 1000
+
+# A RUNNING operation whose progress has not moved for this long is assumed dead and may be reclaimed.
+SUBTREE_OPERATION_STALE_AFTER = timedelta(minutes=10)
+
+
+def subtree_levels(root_id, batch_size=1000):
+    """
+    Location ids of the subtree rooted at ``root_id``, one list per depth (root first),
+    found with one set-based query per level and batch instead of one per node.
+    """
+    levels = []
+    frontier = list(Location.objects.filter(pk=root_id).values_list('pk', flat=True))
+    seen = set(frontier)
+    while frontier:
+        levels.append(frontier)
+        children = []
+        for start in range(0, len(frontier), batch_size):
+            batch = frontier[start:start + batch_size]
+            children.extend(Location.objects.filter(parent_id__in=batch).values_list('pk', flat=True))
+        frontier = [pk for pk in children if pk not in seen]
+        seen.update(frontier)
+    return levels
+
+
+def subtree_counts(root_id):
+    """Number of rows per model that removing the subtree would touch, without loading any of them."""
+    location_ids = [pk for level in subtree_levels(root_id) for pk in level]
+    accommodations = Accommodation.objects.filter(location_id__in=location_ids)
+    return {
+        Location: len(location_ids),
+        Accommodation: accommodations.count(),
+        AccommodationImage: AccommodationImage.objects.filter(accommodation__in=accommodations).count(),
+        LocalizeAccommodation: LocalizeAccommodation.objects.filter(accommodation__in=accommodations).count(),
+    }
+
+
+def archive_rows(operation, model, pks):
+    """Copy rows into ArchivedRecord with one INSERT ... SELECT, as JSON of their column values."""
+    if not pks:
+        return
+    quote = connection.ops.quote_name
+    archive = ArchivedRecord._meta
+    pk_column = quote(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(archive.db_table)} "
+            f"({quote(archive.get_field('operation').column)}, {quote('model')}, {quote('object_id')}, {quote('data')}, {quote('archived_at')}) "
+            f"SELECT %s, %s, t.{pk_column}::text, to_jsonb(t), now() FROM {quote(model._meta.db_table)} t "
+            f"WHERE t.{pk_column} = ANY(%s)",
+            [operation.pk, model._meta.label_lower, list(pks)],
+        )
+
+
+def _remove_accommodations(operation, pks):
+    archiving = operation.mode == LocationSubtreeOperation.ARCHIVE
+    if archiving:
+        archive_rows(operation, Accommodation, pks)
+        for model in (AccommodationImage, LocalizeAccommodation):
+            archive_rows(operation, model, list(
+                model.objects.filter(accommodation_id__in=pks).values_list('pk', flat=True)
+            ))
+    # Archived image rows still point at their files, so only deletions queue files for the sweep.
+    bulk.apply_to_chunk(BulkAccommodationJob.DELETE, pks, sweep_files=not archiving)
+
+
+def _remove_locations(operation, pks):
+    if operation.mode == LocationSubtreeOperation.ARCHIVE:
+        archive_rows(operation, Location, pks)
+    Location.objects.filter(pk__in=pks).delete()
+
+
+def claim_operation(retry_failed=False):
+    """
+    Atomically pick the oldest pending operation (or a RUNNING one whose runner went quiet, or
+    with ``retry_failed`` a FAILED one) and mark it RUNNING. Rows locked by another runner are
+    skipped, so each has a single runner.
+    """
+    stale = timezone.now() - SUBTREE_OPERATION_STALE_AFTER
+    claimable = (
+        Q(status=LocationSubtreeOperation.PENDING)
+        | Q(status=LocationSubtreeOperation.RUNNING, updated_at__lt=stale)
+    )
+    if retry_failed:
+        claimable |= Q(status=LocationSubtreeOperation.FAILED)
+    operations = LocationSubtreeOperation.objects.select_for_update(skip_locked=True).filter(
+        claimable
+    ).order_by('created_at')
+    with transaction.atomic():
+        operation = operations.first()
+        if operation is not None:
+            operation.status = LocationSubtreeOperation.RUNNING
+            operation.save(update_fields=['status', 'updated_at'])
+    return operation
+
+
+def run_subtree_operation(operation, batch_size=SUBTREE_BATCH_SIZE):
+    """
+    Remove the subtree bottom-up in short transactions of at most ``batch_size`` rows:
+    first the accommodations (with their images and localizations), then the locations
+    from the deepest level up to the root. Every batch removes rows for good, so running
+    the operation again after an interruption simply continues with what is left.
+    """
+    operation.status = LocationSubtreeOperation.RUNNING
+    operation.error = ''
+    operation.save(update_fields=['status', 'error', 'updated_at'])
+    root_parent_id = Location.objects.filter(pk=operation.root_id).values_list('parent_id', flat=True).first()
+
+    try:
+        levels = subtree_levels(operation.root_id)
+        location_ids = [pk for level in levels for pk in level]
+        for start in range(0, len(location_ids), 1000):
+            accommodations = Accommodation.objects.filter(location_id__in=location_ids[start:start + 1000])
+            while True:
+                pks = list(accommodations.order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                with transaction.atomic():
+                    _remove_accommodations(operation, pks)
+                    operation.accommodations_removed += len(pks)
+                    operation.save(update_fields=['accommodations_removed', 'updated_at'])
+
+        for level in reversed(levels):
+            for start in range(0, len(level), batch_size):
+                pks = level[start:start + batch_size]
+                with transaction.atomic():
+                    _remove_locations(operation, pks)
+                    operation.locations_removed += len(pks)
+                    operation.save(update_fields=['locations_removed', 'updated_at'])
+    except Exception as e:
+        operation.status = LocationSubtreeOperation.FAILED
+        operation.error = str(e)
+        operation.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+
+    if root_parent_id:
+        rollups.refresh_location_counts([root_parent_id])
+    operation.status = LocationSubtreeOperation.DONE
+    operation.save(update_fields=['status', 'updated_at'])
+    return operation
@@ -1,11 +1,27 @@
+import os
+import tempfile
+from django.db.models import Count
 from django.test import TestCase
-from django.contrib.auth.models import User
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import Permission, User
 from django.contrib.gis.geos import Point
 from location.models import Location
 from location.models import Accommodation, validate_amenities
+from location.models import AccommodationImage, BulkAccommodationJob
+from location.models import ArchivedRecord, LocalizeAccommodation, LocationSubtreeOperation, PendingFileDeletion
+from location.models import ChangeLogEntry
+from location.changelog import compact_change_log, cursor_of, iter_changes
+from location.subtree import claim_operation, run_subtree_operation
+from location import bulk
+from location.dedup import find_duplicate_candidates
+from location.rollups import find_count_drift, recompute_location_counts
+from location.spatial_index import LocationIndex
 from django.core.exceptions import ValidationError
+from datetime import timedelta
+from django.utils import timezone
 from decimal import Decimal
 import json
+from unittest.mock import patch
 
 class LocationModelTest(TestCase):
 
@@ -80,4 +96,471 @@ class AccommodationModelTest(TestCase):
             validate_amenities(invalid_amenities_long)
 
     def test_accommodation_user_relation(self):
-        self.assertEqual(self.accommodation.user.username, "testuser")
\ No newline at end of file
+        self.assertEqual(self.accommodation.user.username, "testuser")
+
+
+class BulkAccommodationActionTest(TestCase):
+
+    def setUp(self):
+        self.city = Location.objects.create(
+            id="LOC001", title="Test City", center=Point(90.4125, 23.8103),
+            location_type="city", country_code="BD",
+        )
+        self.other_city = Location.objects.create(
+            id="LOC002", title="Other City", center=Point(91.8, 22.3),
+            location_type="city", country_code="BD",
+        )
+        self.user = User.objects.create(username="owner")
+        for i in range(5):
+            Accommodation.objects.create(
+                id=f"ACC00{i}", title=f"Accommodation {i}", country_code="BD",
+                bedroom_count=2, usd_rate=Decimal("100.00"), center=Point(90.4125, 23.8103),
+                location=self.city, user=self.user,
+            )
+
+    def test_publish_and_reassign_in_chunks(self):
+        queryset = Accommodation.objects.filter(user=self.user)
+        self.assertEqual(bulk.apply_bulk_action(queryset, BulkAccommodationJob.PUBLISH, chunk_size=2), 5)
+        self.assertEqual(Accommodation.objects.filter(published=True).count(), 5)
+
+        bulk.apply_bulk_action(queryset, BulkAccommodationJob.REASSIGN, location_id=self.other_city.pk, chunk_size=2)
+        self.assertEqual(self.other_city.accommodations.count(), 5)
+
+    def test_delete_removes_images(self):
+        AccommodationImage.objects.create(accommodation_id="ACC000", image="accommodations/ACC000/images/a.jpg")
+        bulk.apply_bulk_action(Accommodation.objects.all(), BulkAccommodationJob.DELETE, chunk_size=2)
+        self.assertFalse(Accommodation.objects.exists())
+        self.assertFalse(AccommodationImage.objects.exists())
+
+    def test_queued_job_resumes_from_cursor(self):
+        job = bulk.enqueue_bulk_action(
+            Accommodation.objects.filter(published=False), BulkAccommodationJob.PUBLISH, user=self.user
+        )
+        self.assertEqual(job.total, 5)
+        job.last_pk = "ACC001"  # Simulate an interrupted run
+        job.processed = 2
+        bulk.run_job(job, chunk_size=2)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, BulkAccommodationJob.DONE)
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(
+            sorted(Accommodation.objects.filter(published=True).values_list("id", flat=True)),
+            ["ACC002", "ACC003", "ACC004"],
+        )
+
+    def test_claim_job_takes_each_job_once(self):
+        job = bulk.enqueue_bulk_action(Accommodation.objects.all(), BulkAccommodationJob.PUBLISH, user=self.user)
+        self.assertEqual(bulk.claim_job().pk, job.pk)
+        self.assertEqual(BulkAccommodationJob.objects.get(pk=job.pk).status, BulkAccommodationJob.RUNNING)
+        self.assertIsNone(bulk.claim_job())
+
+        # A RUNNING job whose runner stopped reporting progress can be claimed again.
+        BulkAccommodationJob.objects.filter(pk=job.pk).update(
+            updated_at=job.updated_at - bulk.BULK_JOB_STALE_AFTER - timedelta(minutes=1)
+        )
+        self.assertEqual(bulk.claim_job().pk, job.pk)
+
+    def test_failed_job_can_be_retried(self):
+        job = bulk.enqueue_bulk_action(Accommodation.objects.all(), BulkAccommodationJob.PUBLISH, user=self.user)
+        self.assertEqual(job.items.count(), 5)
+        apply_to_chunk, calls = bulk.apply_to_chunk, []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            return apply_to_chunk(*args, **kwargs)
+
+        with patch("location.bulk.apply_to_chunk", side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                bulk.run_job(job, chunk_size=2)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.last_pk), (BulkAccommodationJob.FAILED, 2, "ACC001"))
+        self.assertIsNone(bulk.claim_job())
+        bulk.run_job(bulk.claim_job(job.pk), chunk_size=2)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (BulkAccommodationJob.DONE, 5))
+        self.assertEqual(Accommodation.objects.filter(published=True).count(), 5)
+
+    def test_delete_action_asks_for_confirmation(self):
+        admin_user = User.objects.create_superuser(username="admin", password="secret")
+        self.client.force_login(admin_user)
+        data = {"action": "delete_selected_in_batches", "_selected_action": ["ACC000", "ACC001"]}
+
+        response = self.client.post("/admin/location/accommodation/", data)
+        self.assertContains(response, "delete 2 accommodations")
+        self.assertEqual(Accommodation.objects.count(), 5)
+
+        self.client.post("/admin/location/accommodation/", {**data, "post": "yes"})
+        self.assertEqual(Accommodation.objects.count(), 3)
+
+
+class DuplicateDetectionTest(TestCase):
+
+    def setUp(self):
+        self.city = Location.objects.create(
+            id="LOC001", title="Test City", center=Point(90.4125, 23.8103),
+            location_type="city", country_code="BD",
+        )
+
+    def create_accommodation(self, pk, title, feed, center, usd_rate="100.00"):
+        return Accommodation.objects.create(
+            id=pk, title=title, feed=feed, country_code="BD", bedroom_count=2,
+            usd_rate=Decimal(usd_rate), center=center, location=self.city,
+        )
+
+    def test_finds_nearby_cross_feed_duplicates(self):
+        self.create_accommodation("ACC001", "Lake View Apartment", 1, Point(90.4125, 23.8103))
+        self.create_accommodation("ACC002", "Lake view apartment!", 2, Point(90.4127, 23.8104), "105.00")
+        self.create_accommodation("ACC003", "Lake View Apartment", 2, Point(90.5, 23.9))  # ~13 km away
+        self.create_accommodation("ACC004", "Lake View Apartment", 1, Point(90.4126, 23.8103))  # Same feed
+
+        candidates = find_duplicate_candidates(max_distance=150, workers=1)
+
+        self.assertEqual(
+            [(c["accommodation_id"], c["duplicate_id"]) for c in candidates],
+            [("ACC002", "ACC004"), ("ACC001", "ACC002")],
+        )
+        self.assertGreater(candidates[0]["score"], 0.9)
+
+    def test_endpoint_requires_country_or_bbox(self):
+        self.create_accommodation("ACC001", "Lake View Apartment", 1, Point(90.4125, 23.8103))
+        self.create_accommodation("ACC002", "Lake view apartment!", 2, Point(90.4127, 23.8104))
+        self.client.force_login(User.objects.create_superuser(username="admin", password="secret"))
+
+        self.assertEqual(self.client.get("/duplicates/").status_code, 400)
+        for distance in ("0", "-5", "nan", "inf"):
+            response = self.client.get("/duplicates/", {"country_code": "BD", "distance": distance})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get("/duplicates/", {"bbox": "90.4,23.8,90.5,23.9"})
+        self.assertEqual(response.json()["count"], 1)
+
+
+class LocationRollupCountTest(TestCase):
+
+    def setUp(self):
+        self.country = Location.objects.create(
+            id="BD", title="Bangladesh", center=Point(90.4, 23.7), location_type="country", country_code="BD",
+        )
+        self.state = Location.objects.create(
+            id="BD-DHA", title="Dhaka Division", center=Point(90.4, 23.8), location_type="state",
+            country_code="BD", parent=self.country,
+        )
+        self.city = Location.objects.create(
+            id="BD-DHA-1", title="Dhaka", center=Point(90.4125, 23.8103), location_type="city",
+            country_code="BD", parent=self.state,
+        )
+        self.other_city = Location.objects.create(
+            id="BD-CTG-1", title="Chattogram", center=Point(91.8, 22.3), location_type="city",
+            country_code="BD", parent=self.country,
+        )
+
+    def create_accommodation(self, pk, location, published=False):
+        return Accommodation.objects.create(
+            id=pk, title=f"Accommodation {pk}", country_code="BD", bedroom_count=1,
+            usd_rate=Decimal("50.00"), center=location.center, location=location, published=published,
+        )
+
+    def assertCounts(self, location, total, published):
+        location.refresh_from_db()
+        self.assertEqual((location.accommodation_count, location.published_count), (total, published))
+
+    def test_counts_follow_create_publish_move_and_delete(self):
+        accommodation = self.create_accommodation("ACC001", self.city, published=True)
+        self.create_accommodation("ACC002", self.city)
+        self.assertCounts(self.city, 2, 1)
+        self.assertCounts(self.country, 2, 1)
+
+        accommodation.published = False
+        accommodation.save()
+        self.assertCounts(self.state, 2, 0)
+
+        accommodation.location = self.other_city
+        accommodation.published = True
+        accommodation.save()
+        self.assertCounts(self.state, 1, 0)
+        self.assertCounts(self.other_city, 1, 1)
+        self.assertCounts(self.country, 2, 1)
+
+        accommodation.delete()
+        self.assertCounts(self.other_city, 0, 0)
+        self.assertCounts(self.country, 1, 0)
+        self.assertEqual(find_count_drift(), [])
+
+    def test_counts_follow_bulk_actions_and_reparenting(self):
+        for i in range(3):
+            self.create_accommodation(f"ACC00{i}", self.city)
+        bulk.apply_bulk_action(Accommodation.objects.all(), BulkAccommodationJob.PUBLISH, chunk_size=2)
+        self.assertCounts(self.country, 3, 3)
+
+        bulk.apply_bulk_action(
+            Accommodation.objects.filter(pk="ACC000"), BulkAccommodationJob.REASSIGN, location_id=self.other_city.pk
+        )
+        bulk.apply_bulk_action(Accommodation.objects.filter(pk="ACC001"), BulkAccommodationJob.DELETE)
+        self.assertCounts(self.state, 1, 1)
+        self.assertCounts(self.country, 2, 2)
+
+        self.city.parent = self.country
+        self.city.save()
+        self.assertCounts(self.state, 0, 0)
+        self.assertCounts(self.country, 2, 2)
+        self.assertEqual(find_count_drift(), [])
+
+    def test_saving_a_new_instance_over_an_existing_location(self):
+        self.create_accommodation("ACC001", self.city, published=True)
+        Location(
+            id=self.city.pk, title="Dhaka City", center=self.city.center, location_type="city",
+            country_code="BD", parent=self.country,
+        ).save()
+
+        self.assertCounts(self.city, 1, 1)
+        self.assertCounts(self.state, 0, 0)
+        self.assertCounts(self.country, 1, 1)
+        self.assertEqual(Location.objects.get(pk=self.city.pk).created_at, self.city.created_at)
+        self.assertEqual(find_count_drift(), [])
+
+    def test_recompute_fixes_drift(self):
+        self.create_accommodation("ACC001", self.city, published=True)
+        Location.objects.filter(pk=self.country.pk).update(accommodation_count=7)
+
+        self.assertEqual(find_count_drift(), [("BD", (7, 1), (1, 1))])
+        self.assertEqual(recompute_location_counts(), 1)
+        self.assertCounts(self.country, 1, 1)
+
+
+class LocationIndexTest(TestCase):
+
+    def setUp(self):
+        for pk, title, lon, lat in [
+            ("DHK", "Dhaka", 90.4125, 23.8103),
+            ("CTG", "Chattogram", 91.7832, 22.3569),
+            ("SYL", "Sylhet", 91.8687, 24.8949),
+        ]:
+            Location.objects.create(
+                id=pk, title=title, center=Point(lon, lat), location_type="city", country_code="BD",
+            )
+
+    def test_nearest_and_within_radius(self):
+        index = LocationIndex.from_db(["city"])
+        ids, distances = index.nearest([90.40, 91.80], [23.80, 22.40], k=2)
+        self.assertEqual(ids[:, 0].tolist(), ["DHK", "CTG"])
+        self.assertEqual(ids[0, 1], "SYL")
+        self.assertLess(distances[0, 0], 2000)
+
+        query_idx, ids, distances = index.within_radius([92.0], [23.6], 150_000)
+        self.assertEqual(sorted(ids.tolist()), ["CTG", "SYL"])
+
+    def test_snapshot_and_refresh(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index")
+            LocationIndex.from_db(["city"]).save(path)
+            mapped = LocationIndex.load(path)
+
+            Location.objects.create(
+                id="RAJ", title="Rajshahi", center=Point(88.6042, 24.3745), location_type="city", country_code="BD",
+            )
+            Location.objects.filter(pk="SYL").delete()
+            index = LocationIndex.load(path, mmap=False)
+            self.assertEqual(index.refresh(), 2)
+            index.save(path)
+
+            # The earlier memory-mapped snapshot stays intact after the swap.
+            self.assertEqual(sorted(mapped.ids.tolist()), ["CTG", "DHK", "SYL"])
+            index = LocationIndex.load(path)
+            self.assertEqual(sorted(index.ids.tolist()), ["CTG", "DHK", "RAJ"])
+            self.assertEqual(index.nearest([88.6], [24.4])[0][0, 0], "RAJ")
+
+    def test_refresh_picks_up_late_commits(self):
+        index = LocationIndex.from_db(["city"])
+        # Saved (updated_at stamped) just before the build, but committed only after it read the table.
+        Location.objects.create(
+            id="RAJ", title="Rajshahi", center=Point(88.6042, 24.3745), location_type="city", country_code="BD",
+        )
+        Location.objects.filter(pk="RAJ").update(updated_at=timezone.now() - timedelta(seconds=5))
+
+        self.assertEqual(index.refresh(), 1)
+        self.assertIn("RAJ", index.ids.tolist())
+        self.assertEqual(index.refresh(), 0)
+
+
+class LocationSubtreeOperationTest(TestCase):
+
+    def setUp(self):
+        self.country = Location.objects.create(
+            id="BD", title="Bangladesh", center=Point(90.4, 23.7), location_type="country", country_code="BD",
+        )
+        self.state = Location.objects.create(
+            id="BD-DHA", title="Dhaka Division", center=Point(90.4, 23.8), location_type="state",
+            country_code="BD", parent=self.country,
+        )
+        for i in range(3):
+            city = Location.objects.create(
+                id=f"BD-DHA-{i}", title=f"City {i}", center=Point(90.4, 23.8), location_type="city",
+                country_code="BD", parent=self.state,
+            )
+            accommodation = Accommodation.objects.create(
+                id=f"ACC00{i}", title=f"Accommodation {i}", country_code="BD", bedroom_count=1,
+                usd_rate=Decimal("50.00"), center=city.center, location=city, published=True,
+            )
+            AccommodationImage.objects.create(accommodation=accommodation, image=f"accommodations/ACC00{i}/images/a.jpg")
+            LocalizeAccommodation.objects.create(accommodation=accommodation, language="en", description="Nice")
+
+    def test_delete_subtree_in_batches(self):
+        operation = LocationSubtreeOperation.objects.create(root_id="BD-DHA")
+        run_subtree_operation(operation, batch_size=2)
+
+        self.assertEqual(operation.status, LocationSubtreeOperation.DONE)
+        self.assertEqual((operation.locations_removed, operation.accommodations_removed), (4, 3))
+        self.assertEqual(list(Location.objects.values_list("id", flat=True)), ["BD"])
+        self.assertFalse(AccommodationImage.objects.exists())
+        self.assertFalse(LocalizeAccommodation.objects.exists())
+        self.assertEqual(PendingFileDeletion.objects.count(), 3)
+        self.country.refresh_from_db()
+        self.assertEqual((self.country.accommodation_count, self.country.published_count), (0, 0))
+
+        # Running it again (e.g. after an interruption) finds nothing left to do.
+        run_subtree_operation(operation)
+        self.assertEqual(operation.status, LocationSubtreeOperation.DONE)
+
+    def test_archive_subtree(self):
+        operation = LocationSubtreeOperation.objects.create(root_id="BD", mode=LocationSubtreeOperation.ARCHIVE)
+        run_subtree_operation(operation, batch_size=2)
+
+        self.assertFalse(Location.objects.exists())
+        self.assertFalse(PendingFileDeletion.objects.exists())
+        archived = {row["model"]: row["n"] for row in ArchivedRecord.objects.values("model").annotate(n=Count("pk"))}
+        self.assertEqual(archived, {
+            "location.location": 5,
+            "location.accommodation": 3,
+            "location.accommodationimage": 3,
+            "location.localizeaccommodation": 3,
+        })
+        self.assertEqual(ArchivedRecord.objects.get(object_id="ACC001").data["title"], "Accommodation 1")
+
+    def test_claim_operation_takes_each_operation_once(self):
+        operation = LocationSubtreeOperation.objects.create(root_id="BD-DHA")
+        self.assertEqual(claim_operation().pk, operation.pk)
+        self.assertIsNone(claim_operation())
+
+        LocationSubtreeOperation.objects.filter(pk=operation.pk).update(status=LocationSubtreeOperation.FAILED)
+        self.assertIsNone(claim_operation())
+        self.assertEqual(claim_operation(retry_failed=True).pk, operation.pk)
+
+    def test_admin_requires_delete_permission_for_everything_below(self):
+        staff = User.objects.create_user(username="staff", password="secret", is_staff=True)
+        staff.user_permissions.add(*Permission.objects.filter(codename__in=["view_location", "delete_location"]))
+        self.client.force_login(staff)
+
+        for action in ("archive_subtree", "delete_selected"):
+            response = self.client.post(
+                "/admin/location/location/", {"action": action, "_selected_action": ["BD-DHA"], "post": "yes"}
+            )
+            self.assertEqual(response.status_code, 403)
+        self.assertEqual(Accommodation.objects.count(), 3)
+        self.assertFalse(LocationSubtreeOperation.objects.exists())
+
+    def test_admin_reports_queued_delete(self):
+        self.client.force_login(User.objects.create_superuser(username="admin", password="secret"))
+        with patch("location.subtree.SUBTREE_SYNC_LIMIT", 1):
+            response = self.client.post("/admin/location/location/BD/delete/", {"post": "yes"}, follow=True)
+
+        self.assertTrue(Location.objects.filter(pk="BD").exists())
+        operation = LocationSubtreeOperation.objects.get()
+        self.assertEqual(operation.status, LocationSubtreeOperation.PENDING)
+        self.assertContains(response, f"queued for deletion as operation #{operation.pk}")
+        self.assertNotContains(response, "deleted successfully")
+        self.assertFalse(LogEntry.objects.exists())
+
+
+class ChangeLogTest(TestCase):
+
+    def setUp(self):
+        self.city = Location.objects.create(
+            id="LOC001", title="Test City", center=Point(90.4125, 23.8103),
+            location_type="city", country_code="BD",
+        )
+        self.accommodation = Accommodation.objects.create(
+            id="ACC001", title="Test Accommodation", country_code="BD", bedroom_count=2,
+            usd_rate=Decimal("100.00"), center=Point(90.4125, 23.8103), location=self.city,
+        )
+
+    def changes(self):
+        return list(ChangeLogEntry.objects.order_by("id").values_list("model", "object_id", "action"))
+
+    def test_changes_are_logged(self):
+        image = AccommodationImage.objects.create(accommodation=self.accommodation, image="accommodations/ACC001/images/a.jpg")
+        bulk.apply_bulk_action(Accommodation.objects.all(), BulkAccommodationJob.PUBLISH)
+        self.accommodation.delete()
+
+        self.assertEqual(self.changes(), [
+            ("location.location", "LOC001", "upsert"),
+            ("location.accommodation", "ACC001", "upsert"),
+            ("location.accommodationimage", str(image.pk), "upsert"),
+            ("location.accommodation", "ACC001", "upsert"),
+            ("location.accommodationimage", str(image.pk), "delete"),
+            ("location.accommodation", "ACC001", "delete"),
+        ])
+        published = ChangeLogEntry.objects.filter(model="location.accommodation", action="upsert").last()
+        self.assertTrue(published.data["published"])
+        self.assertNotIn("accommodation_count", ChangeLogEntry.objects.first().data)
+
+    def test_compaction_keeps_latest_entry_per_object(self):
+        self.accommodation.title = "Renamed"
+        self.accommodation.save()
+        ChangeLogEntry.objects.update(created_at=self.accommodation.created_at - timedelta(days=2))
+
+        self.assertEqual(compact_change_log(), 1)
+        self.assertEqual(self.changes(), [
+            ("location.location", "LOC001", "upsert"),
+            ("location.accommodation", "ACC001", "upsert"),
+        ])
+        self.assertEqual(ChangeLogEntry.objects.last().data["title"], "Renamed")
+
+    def test_compaction_walks_the_window_in_batches(self):
+        self.accommodation.title = "Renamed"
+        self.accommodation.save()
+        self.accommodation.delete()
+        ChangeLogEntry.objects.update(created_at=self.accommodation.created_at - timedelta(days=40))
+
+        self.assertEqual(compact_change_log(batch_size=1), 3)
+        self.assertEqual(self.changes(), [("location.location", "LOC001", "upsert")])
+
+    def test_change_feed_streams_after_cursor(self):
+        cursor = cursor_of(ChangeLogEntry.objects.order_by("id").first())
+        self.assertEqual(self.client.get("/changes/").status_code, 403)
+
+        staff = User.objects.create_user(username="staff", password="secret", is_staff=True)
+        self.client.force_login(staff)
+        # The test's own transaction is still open, so move the safe point past it.
+        with patch("location.changelog.snapshot_xmin", return_value=2 ** 62):
+            response = self.client.get("/changes/", {"after": cursor})
+            lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual([(line["model"], line["object_id"]) for line in lines], [("location.accommodation", "ACC001")])
+        self.assertEqual(lines[0]["cursor"], cursor_of(ChangeLogEntry.objects.order_by("id").last()))
+
+    def test_feed_survives_out_of_order_commits(self):
+        ChangeLogEntry.objects.all().delete()
+
+        def entry(pk, xid):
+            return ChangeLogEntry.objects.create(
+                id=pk, xid=xid, model="location.accommodation", object_id=f"ACC{pk}", action=ChangeLogEntry.UPSERT
+            )
+
+        def read(after, xmin):
+            with patch("location.changelog.snapshot_xmin", return_value=xmin):
+                return [(change.id, cursor_of(change)) for change in iter_changes(after)]
+
+        # Transaction 101 takes id 10 but is still open while transaction 100 takes id 11 and commits.
+        entry(11, xid=100)
+        self.assertEqual(read("0", xmin=101), [(11, "100-11")])
+        # Transaction 101 commits afterwards, and transaction 103 (id 12) commits before 102 (id 13).
+        entry(10, xid=101)
+        entry(12, xid=103)
+        self.assertEqual(read("100-11", xmin=102), [(10, "101-10")])
+        entry(13, xid=102)
+        self.assertEqual(read("101-10", xmin=104), [(13, "102-13"), (12, "103-12")])
@@ -1,7 +1,21 @@
+import math
 from django.shortcuts import render, redirect, HttpResponse
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.gis.geos import Polygon
 from django.contrib.auth.models import User, Group
 from django.contrib import messages
 from django.core.exceptions import ValidationError
+from .changelog import iter_changes, parse_cursor, to_ndjson
+from .dedup import find_duplicate_candidates
+from .models import Accommodation
+
+
+# Bounds for the duplicates endpoint, which scores pairs inside the request.
+MAX_DUPLICATE_DISTANCE = 1000
+MAX_DUPLICATE_LIMIT = 1000
 
 
 def index(request):
@@ -62,3 +76,66 @@ def register(request):
             return redirect('register')
 
     return render(request, 'register.html')
+
+
+@staff_member_required
+def duplicate_candidates(request):
+    """
+    Ranked likely-duplicate accommodation pairs as JSON for one country (``country_code``)
+    or bounding box (``bbox=min_lon,min_lat,max_lon,max_lat``). Scoring runs in-process;
+    use the find_duplicates command for a full scan.
+    """
+    try:
+        max_distance = float(request.GET.get('distance', 150))
+        min_score = float(request.GET.get('min_score', 0.75))
+        limit = int(request.GET.get('limit', 100))
+        bbox = [float(value) for value in request.GET['bbox'].split(',')] if 'bbox' in request.GET else None
+        if not all(math.isfinite(value) for value in [max_distance, min_score, *(bbox or [])]):
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': "distance, min_score, limit and bbox must be finite numbers."}, status=400)
+    if max_distance <= 0 or limit <= 0:
+        return JsonResponse({'error': "distance and limit must be greater than 0."}, status=400)
+    max_distance, limit = min(max_distance, MAX_DUPLICATE_DISTANCE), min(limit, MAX_DUPLICATE_LIMIT)
+
+    queryset = Accommodation.objects.all()
+    country_code = request.GET.get('country_code')
+    if country_code:
+        queryset = queryset.filter(country_code=country_code.upper())
+    if bbox:
+        if len(bbox) != 4:
+            return JsonResponse({'error': "bbox must be min_lon,min_lat,max_lon,max_lat."}, status=400)
+        queryset = queryset.filter(center__within=Polygon.from_bbox(bbox))
+    if not country_code and not bbox:
+        return JsonResponse({'error': "Pass country_code or bbox to bound the search."}, status=400)
+
+    candidates = find_duplicate_candidates(
+        queryset,
+        max_distance=max_distance,
+        min_score=min_score,
+        cross_feed_only=request.GET.get('same_feed') != '1',
+        workers=1,
+        limit=limit,
+    )
+    return JsonResponse({'count': len(candidates), 'results': candidates})
+
+
+def change_feed(request):
+    """
+    Stream change-log entries after ``?after=<cursor>`` as NDJSON, up to ``?limit=`` entries.
+    Open to staff sessions, or to consumers sending ``Authorization: Bearer <CHANGE_FEED_TOKEN>``.
+    """
+    token = getattr(settings, 'CHANGE_FEED_TOKEN', None)
+    bearer = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not (request.user.is_active and request.user.is_staff) and not (token and constant_time_compare(bearer, token)):
+        return JsonResponse({'error': "Authentication required."}, status=403)
+
+    try:
+        after = request.GET.get('after', '0')
+        parse_cursor(after)
+        limit = int(request.GET['limit']) if 'limit' in request.GET else None
+    except ValueError:
+        return JsonResponse({'error': "after must be a cursor from this feed and limit an integer."}, status=400)
+
+    entries = iter_changes(after=after, limit=limit)
+    return StreamingHttpResponse((to_ndjson(entry) for entry in entries), content_type='application/x-ndjson')